@@ -378,6 +378,17 @@ class SegmentationModelBase(ModelConfigBase):
     store_dataset_sample: bool = param.Boolean(False, doc="If True save image and segmentations for one image"
                                                           "in a batch for each training epoch")
 
+    #: If True, use the channels_last_3d memory format for the model weights and input images
+    use_channels_last_3d: bool = param.Boolean(False, doc="If True, convert the model weights and the input images "
+                                                          "to the channels_last_3d memory format. This can speed up "
+                                                          "3D convolutions on recent GPUs.")
+
+    #: If True, run the model forward pass and loss computation in bfloat16 autocast during training and validation
+    use_bfloat16_autocast: bool = param.Boolean(False, doc="If True, run the model forward pass and the loss "
+                                                           "computation with bfloat16 autocast during training and "
+                                                           "validation. This requires PyTorch 1.10 or higher, and "
+                                                           "is skipped on older versions.")
+
     #: List of (name, container) pairs, where name is a descriptive name and container is a Azure ML storage account
     #: container name to be used for statistical comparisons
     comparison_blob_storage_paths: List[Tuple[str, str]] = param.List(
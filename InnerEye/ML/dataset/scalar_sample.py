@@ -90,20 +90,38 @@ class ScalarItem(ScalarItemBase):
         _dim = 0 if self.numerical_non_image_features.ndimension() == 1 else 1
         return torch.cat([self.numerical_non_image_features, self.categorical_non_image_features], dim=_dim)
 
-    def to_device(self, device: Any) -> ScalarItem:
+    def to_device(self, device: Any, non_blocking: bool = False) -> ScalarItem:
         """
         Creates a copy of the present object where all tensors live on the given CUDA device.
         The metadata field is left unchanged.
         :param device: The CUDA or GPU device to move to.
+        :param non_blocking: If True, and the tensors are in pinned memory, the copies to the device are asynchronous
+        with respect to the host.
         :return: A new `ScalarItem` with all tensors on the chosen device.
         """
         return ScalarItem(
             metadata=self.metadata,
-            label=self.label.to(device),
-            categorical_non_image_features=self.categorical_non_image_features.to(device),
-            numerical_non_image_features=self.numerical_non_image_features.to(device),
-            images=self.images.to(device),
-            segmentations=None if self.segmentations is None else self.segmentations.to(device)
+            label=self.label.to(device, non_blocking=non_blocking),
+            categorical_non_image_features=self.categorical_non_image_features.to(device, non_blocking=non_blocking),
+            numerical_non_image_features=self.numerical_non_image_features.to(device, non_blocking=non_blocking),
+            images=self.images.to(device, non_blocking=non_blocking),
+            segmentations=None if self.segmentations is None
+            else self.segmentations.to(device, non_blocking=non_blocking)
+        )
+
+    def pin_memory(self) -> ScalarItem:
+        """
+        Creates a copy of the present object where all tensors live in pinned (page-locked) CPU memory. This is called
+        by the PyTorch data loader when its pin_memory flag is set, and enables asynchronous copies to the GPU.
+        :return: A new `ScalarItem` with all tensors in pinned memory.
+        """
+        return ScalarItem(
+            metadata=self.metadata,
+            label=self.label.pin_memory(),
+            categorical_non_image_features=self.categorical_non_image_features.pin_memory(),
+            numerical_non_image_features=self.numerical_non_image_features.pin_memory(),
+            images=self.images.pin_memory(),
+            segmentations=None if self.segmentations is None else self.segmentations.pin_memory()
         )
 
 
@@ -378,6 +378,21 @@ class DeepLearningConfig(GenericConfig, CudaAwareConfig):
                       doc="Controls the PyTorch Lightning trainer flags 'deterministic' and 'benchmark'. If "
                           "'pl_deterministic' is True, results are perfectly reproducible. If False, they are not, but "
                           "you may see training speed increases.")
+    use_torch_compile: bool = \
+        param.Boolean(default=False,
+                      doc="If True, compile the model with torch.compile before training. This requires PyTorch 2.2 "
+                          "or higher, and is skipped on older versions. The first minibatch will be slow because "
+                          "of compilation.")
+    ddp_bucket_cap_mb: int = \
+        param.Integer(default=25, bounds=(1, None),
+                      doc="When training on multiple GPUs with distributed data parallel (DDP), gradients are "
+                          "all-reduced in buckets of this size (in MB) while the backward pass is still running. Larger "
+                          "buckets (for example 50) can give better overlap of communication and computation for "
+                          "models with large gradient tensors.")
+    ddp_gradient_as_bucket_view: bool = \
+        param.Boolean(default=False,
+                      doc="When training on multiple GPUs with distributed data parallel (DDP), let the gradients "
+                          "be views into the all-reduce buckets. This saves the memory of one copy of all gradients.")
 
     #: Name of the csv file providing information on the dataset to be used.
     dataset_csv: str = param.String(
@@ -29,6 +29,18 @@ def nanmean(values: torch.Tensor) -> torch.Tensor:
     return valid.mean()
 
 
+def nanmean_per_row(values: torch.Tensor) -> torch.Tensor:
+    """
+    Computes the average of each row of a matrix, skipping those entries that are NaN (not a number).
+    If all values in a row are NaN, the result for that row is also NaN.
+    :param values: The values to average, as a matrix of size [rows, columns].
+    :return: A tensor with one entry per row, containing the averages.
+    """
+    is_valid = ~torch.isnan(values)
+    sums = torch.where(is_valid, values, torch.zeros_like(values)).sum(dim=1)
+    return sums / is_valid.sum(dim=1).to(dtype=values.dtype)
+
+
 class MeanAbsoluteError(metrics.MeanAbsoluteError):
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
@@ -100,10 +112,9 @@ class AverageWithoutNan(Metric):
         """
         Stores all the given individual elements of the given tensor in the present object.
         """
-        for v in value.view((-1,)):
-            if not torch.isnan(v):
-                self.sum = self.sum + v  # type: ignore
-                self.count = self.count + 1  # type: ignore
+        valid = value[~torch.isnan(value)]
+        self.sum = self.sum + valid.sum()  # type: ignore
+        self.count = self.count + valid.numel()  # type: ignore
 
     def compute(self) -> torch.Tensor:
         if self.count == 0.0:
@@ -166,6 +177,8 @@ class ScalarMetricsBase(Metric):
         assert isinstance(thresholds, torch.Tensor)
         optimal_idx = torch.argmax(tpr - fpr)
         optimal_threshold = thresholds[optimal_idx]
+        # Outputs equal to the threshold count as negative here, unlike in get_metrics_at_threshold in the
+        # classification report, hence the accuracies in the training metrics and in the report can differ.
         acc = accuracy(preds > optimal_threshold, targets)
         false_negative_optimal = 1 - tpr[optimal_idx]
         false_positive_optimal = fpr[optimal_idx]
@@ -296,17 +309,20 @@ class MetricForMultipleStructures(torch.nn.Module):
 
     def update(self, values_per_structure: torch.Tensor) -> None:
         """
-        Stores a vector of per-structure Dice scores in the present object. It updates the per-structure values,
+        Stores per-structure Dice scores in the present object. It updates the per-structure values,
         and the aggregate value across all structures.
-        :param values_per_structure: A row tensor that has as many entries as there are ground truth IDs.
+        :param values_per_structure: A row tensor that has as many entries as there are ground truth IDs, or a
+        matrix of size [samples, ground truth IDs], where each row is treated as an independent sample.
         """
-        if values_per_structure.dim() != 1 or values_per_structure.numel() != self.count:
-            raise ValueError(f"Expected a tensor with {self.count} elements, but "
+        if values_per_structure.dim() == 1:
+            values_per_structure = values_per_structure.unsqueeze(0)
+        if values_per_structure.dim() != 2 or values_per_structure.shape[1] != self.count:
+            raise ValueError(f"Expected a tensor with {self.count} elements per row, but "
                              f"got shape {values_per_structure.shape}")
-        for i, v in enumerate(values_per_structure.view((-1,))):
-            self.average_per_structure[i].update(v)
+        for i, metric in enumerate(self.average_per_structure):
+            metric.update(values_per_structure[:, i])
         if self.use_average_across_structures:
-            self.average_all.update(nanmean(values_per_structure))
+            self.average_all.update(nanmean_per_row(values_per_structure))
 
     def __iter__(self) -> Iterator[Metric]:
         """
@@ -2,9 +2,16 @@
 #  Copyright (c) Microsoft Corporation. All rights reserved.
 #  Licensed under the MIT License (MIT). See LICENSE in the repo root for license information.
 #  ------------------------------------------------------------------------------------------
-from typing import Any, Dict, List, Tuple
-
+import contextlib
+from functools import partial
+import logging
+import queue
+import threading
+from typing import Any, ContextManager, Dict, List, Optional, Tuple, Union
+
+import numpy as np
 import torch
+from pytorch_lightning.metrics import Metric
 from pytorch_lightning.utilities import move_data_to_device
 from torch.nn import ModuleDict, ModuleList
 
@@ -38,6 +45,20 @@ class SegmentationLightning(InnerEyeLightning):
     def __init__(self, config: SegmentationModelBase, *args: Any, **kwargs: Any) -> None:
         super().__init__(config, *args, **kwargs)
         self.model = config.create_model()
+        self.use_channels_last_3d = config.use_channels_last_3d
+        if self.use_channels_last_3d:
+            # Module.to(memory_format=...) only converts 4D parameters, hence convert the 5D weights explicitly.
+            for parameter in self.model.parameters():
+                if parameter.dim() == 5:
+                    parameter.data = parameter.data.contiguous(memory_format=torch.channels_last_3d)  # type: ignore
+        self.use_bfloat16_autocast = config.use_bfloat16_autocast
+        if self.use_bfloat16_autocast and not hasattr(torch, "autocast"):
+            logging.warning(f"bfloat16 autocast requires PyTorch 1.10 or higher, but found {torch.__version__}. "
+                            "Training will use the default precision.")
+            self.use_bfloat16_autocast = False
+        # Crops have a fixed size throughout training, hence the compiled model does not need dynamic shapes.
+        if config.use_torch_compile:
+            model_util.compile_model(self.model, mode="reduce-overhead", dynamic=False)
         self.loss_fn = model_util.create_segmentation_loss_function(config)
         self.ground_truth_ids = config.ground_truth_ids
         self.train_dice = MetricForMultipleStructures(ground_truth_ids=self.ground_truth_ids, is_training=True)
@@ -49,13 +70,19 @@ class SegmentationLightning(InnerEyeLightning):
                                                       metric_name=MetricType.VOXEL_COUNT.value,
                                                       use_average_across_structures=False)
 
-    def forward(self, patches: torch.Tensor) -> torch.Tensor:  # type: ignore
+    def forward(self, patches: torch.Tensor, return_posteriors: bool = True) -> torch.Tensor:  # type: ignore
         """
         Runs a set of 3D crops through the segmentation model, and returns the result. This method is used
         at inference time.
         :param patches: A tensor of size [batches, channels, Z, Y, X]
+        :param return_posteriors: If True, return the posteriors of size [batches, classes, Z, Y, X]. If False,
+        return the segmentation of size [batches, Z, Y, X], computed via argmax on the logits without Softmax.
         """
-        return self.logits_to_posterior(self.model(patches))
+        logits = self.model(self.to_model_memory_format(patches))
+        if return_posteriors:
+            return self.logits_to_posterior(logits)
+        # Softmax is monotonic, hence argmax on the logits gives the same result as argmax on the posteriors.
+        return logits.argmax(dim=1)
 
     def logits_to_posterior(self, logits: torch.Tensor) -> torch.Tensor:
         """
@@ -63,6 +90,24 @@ class SegmentationLightning(InnerEyeLightning):
         """
         return torch.nn.functional.softmax(logits, dim=1)
 
+    def to_model_memory_format(self, image: torch.Tensor) -> torch.Tensor:
+        """
+        Converts an image tensor to the memory format that the model weights use.
+        :param image: A tensor of size [batches, channels, Z, Y, X]
+        """
+        if self.use_channels_last_3d:
+            return image.to(memory_format=torch.channels_last_3d)  # type: ignore
+        return image
+
+    def autocast_context(self, device: torch.device) -> ContextManager:
+        """
+        Gets a context manager that runs the enclosed operations in bfloat16 autocast, if enabled in the config.
+        :param device: The device on which the enclosed operations run.
+        """
+        if self.use_bfloat16_autocast:
+            return torch.autocast(device_type=device.type, dtype=torch.bfloat16)  # type: ignore
+        return contextlib.nullcontext()
+
     def training_or_validation_step(self,
                                     sample: Dict[str, Any],
                                     batch_index: int,
@@ -80,22 +125,21 @@ class SegmentationLightning(InnerEyeLightning):
         labels = cropped_sample.labels_center_crop
 
         mask = cropped_sample.mask_center_crop if is_training else None
-        if is_training:
-            logits = self.model(cropped_sample.image)
+        # Lightning already disables gradient computation when calling validation_step.
+        with self.autocast_context(cropped_sample.image.device):
+            logits = self.model(self.to_model_memory_format(cropped_sample.image))
+            loss = self.loss_fn(logits, labels)
+        # Posteriors and metrics are computed in full precision.
+        logits = logits.float()
+
+        # Posteriors are only needed if a mask has to be applied. Otherwise, compute the segmentation directly from
+        # the logits: Softmax is monotonic, hence argmax on the logits gives the same result as on the posteriors.
+        if mask is None:
+            segmentation = logits.argmax(dim=1)
         else:
-            with torch.no_grad():
-                logits = self.model(cropped_sample.image)
-        loss = self.loss_fn(logits, labels)
-
-        # apply Softmax on dimension 1 (Class) to map model output into a posterior probability distribution [0,1]
-        posteriors = self.logits_to_posterior(logits)
-
-        # apply mask if required
-        if mask is not None:
-            posteriors = image_util.apply_mask_to_posteriors(posteriors=posteriors, mask=mask)
-
-        # post process posteriors to compute result
-        segmentation = image_util.posteriors_to_segmentation(posteriors=posteriors)
+            # Apply Softmax on dimension 1 (Class), apply the mask, and post process posteriors to compute
+            # the segmentation. All of this is done in a single scripted function, to reduce memory traffic.
+            _, segmentation = image_util.fuse_logits_to_segmentation(logits, mask)
         self.compute_metrics(cropped_sample, segmentation, is_training)
 
         self.write_loss(is_training, loss)
@@ -108,30 +152,30 @@ class SegmentationLightning(InnerEyeLightning):
         :param cropped_sample: The batched image crops used for training or validation.
         :param segmentation: The segmentation that was produced by the model.
         """
+        dice = self.train_dice if is_training else self.val_dice
+        voxel_count = self.train_voxels if is_training else self.val_voxels
+        diagnostics = self.train_diagnostics if is_training else self.val_diagnostics
         # dice_per_crop_and_class has one row per crop, with background class removed
         # Dice NaN means that both ground truth and prediction are empty.
         dice_per_crop_and_class = compute_dice_across_patches(
             segmentation=segmentation,
             ground_truth=cropped_sample.labels_center_crop,
-            allow_multiple_classes_for_each_pixel=True)[:, 1:]
+            allow_multiple_classes_for_each_pixel=True,
+            skip_background=True)
         # Number of foreground voxels per class, across all crops
-        foreground_voxels = metrics_util.get_number_of_voxels_per_class(cropped_sample.labels)[:, 1:]
+        foreground_voxels = metrics_util.get_number_of_voxels_per_class(cropped_sample.labels, skip_background=True)
         # Store Dice and voxel count per sample in the minibatch. We need a custom aggregation logic for Dice
         # because it can be NaN. Also use custom logging for voxel count because Lightning's batch-size weighted
         # average has a bug.
-        for i in range(dice_per_crop_and_class.shape[0]):
-            dice = self.train_dice if is_training else self.val_dice
-            dice.update(dice_per_crop_and_class[i, :])
-            voxel_count = self.train_voxels if is_training else self.val_voxels
-            voxel_count.update(foreground_voxels[i, :])
-        # store diagnostics per batch
+        # Each row (crop) of the tensors is treated as an independent sample.
+        dice.update(dice_per_crop_and_class)
+        voxel_count.update(foreground_voxels)
+        # store diagnostics per batch. Tensors are kept on the device, to avoid synchronizing with the GPU at each
+        # step. They are converted to numpy at the end of the epoch.
         center_indices = cropped_sample.center_indices
         if isinstance(center_indices, torch.Tensor):
-            center_indices = center_indices.cpu().numpy()
-        if is_training:
-            self.train_diagnostics.append(center_indices)
-        else:
-            self.val_diagnostics.append(center_indices)
+            center_indices = center_indices.detach()
+        diagnostics.append(center_indices)
         # if self.train_val_params.in_training_mode:
         #     # store the sample train patch from this epoch for visualization
         #     if batch_index == self.example_to_save and self.config.store_dataset_sample:
@@ -149,16 +193,32 @@ class SegmentationLightning(InnerEyeLightning):
         Writes all training or validation metrics that were aggregated over the epoch to the loggers.
         """
         dice = self.train_dice if is_training else self.val_dice
-        for name, value in dice.compute_all():
-            self.log(name, value)
+        self.log_dict(dict(dice.compute_all()))
         dice.reset()
         voxel_count = self.train_voxels if is_training else self.val_voxels
-        for name, value in voxel_count.compute_all():
-            self.log(name, value)
+        self.log_dict(dict(voxel_count.compute_all()))
         voxel_count.reset()
+        convert_diagnostics_to_numpy(self.train_diagnostics if is_training else self.val_diagnostics)
         super().training_or_validation_epoch_end(is_training=is_training)
 
 
+def convert_diagnostics_to_numpy(diagnostics: List[Any]) -> None:
+    """
+    Converts all tensors in a list of per-batch diagnostics to numpy arrays, in-place. All tensors are copied to the
+    CPU in a single operation.
+    :param diagnostics: A list with one entry per batch. Entries that are tensors must all live on the same device,
+    and have the same size along all but the first dimension.
+    """
+    tensor_indices = [i for i, d in enumerate(diagnostics) if isinstance(d, torch.Tensor)]
+    if not tensor_indices:
+        return
+    tensors = [diagnostics[i] for i in tensor_indices]
+    all_values = torch.cat(tensors).cpu().numpy()
+    split_points = np.cumsum([len(t) for t in tensors])[:-1]
+    for i, values in zip(tensor_indices, np.split(all_values, split_points)):
+        diagnostics[i] = values
+
+
 def get_subject_output_file_per_rank(rank: int) -> str:
     """
     Gets the name of a file that will store the per-rank per-subject model outputs.
@@ -168,6 +228,123 @@ def get_subject_output_file_per_rank(rank: int) -> str:
     return f"{SUBJECT_OUTPUT_PER_RANK_PREFIX}{rank}"
 
 
+class PinnedStagingBuffers:
+    """
+    Pinned CPU buffers and a CUDA event that are used to copy one batch of model outputs off the GPU without blocking.
+    The buffers are re-used across batches, as long as the shape and type of the copied tensors do not change.
+    """
+
+    def __init__(self) -> None:
+        self.buffers: Dict[str, torch.Tensor] = {}
+        self.copy_done = torch.cuda.Event()
+
+    def copy_non_blocking(self, name: str, tensor: torch.Tensor) -> torch.Tensor:
+        """
+        Starts copying the given GPU tensor into the pinned buffer for the given name, without waiting for the copy to
+        finish.
+        :param name: The name of the buffer to copy to.
+        :param tensor: The tensor to copy.
+        :return: The pinned CPU buffer. Its contents are only valid once the copy_done event has completed.
+        """
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != tensor.shape or buffer.dtype != tensor.dtype:
+            buffer = torch.empty(tensor.shape, dtype=tensor.dtype, pin_memory=True)
+            self.buffers[name] = buffer
+        buffer.copy_(tensor.detach(), non_blocking=True)
+        return buffer
+
+
+class SubjectOutputsWriter:
+    """
+    Writes per-subject model outputs to DataframeLogger objects in a background thread. Model outputs are copied
+    from the GPU without blocking, and converted to Python lists in the background thread, such that training
+    does not need to wait for the GPU at each minibatch.
+    """
+
+    def __init__(self) -> None:
+        self.queue: queue.Queue = queue.Queue()
+        # Staging buffers that are not in use by any pending batch, and can be re-used for the next GPU copy.
+        self.free_staging_buffers: queue.Queue = queue.Queue()
+        self.error: Optional[Exception] = None
+        self.is_closed = False
+        self.thread = threading.Thread(target=self._run, name="SubjectOutputsWriter", daemon=True)
+        self.thread.start()
+
+    def _check_not_closed(self) -> None:
+        if self.is_closed:
+            raise ValueError("The writer for subject outputs has already been closed.")
+
+    def add_records(self, logger: DataframeLogger, columns: Dict[str, Union[List[Any], torch.Tensor]]) -> None:
+        """
+        Enqueues records in column format, to be written to the given logger. Columns can either be a list of
+        plain values, or a tensor. Tensors contribute one record per entry along their first dimension, and are
+        copied to the CPU with a single copy per column.
+        :param logger: The logger that should receive the records.
+        :param columns: A dictionary mapping from column name to the values in that column.
+        """
+        self._check_not_closed()
+        staged: Dict[str, Union[List[Any], torch.Tensor]] = {}
+        staging_buffers: Optional[PinnedStagingBuffers] = None
+        for name, values in columns.items():
+            if isinstance(values, torch.Tensor) and values.is_cuda:
+                if staging_buffers is None:
+                    try:
+                        staging_buffers = self.free_staging_buffers.get_nowait()
+                    except queue.Empty:
+                        staging_buffers = PinnedStagingBuffers()
+                staged[name] = staging_buffers.copy_non_blocking(name, values)
+            elif isinstance(values, torch.Tensor):
+                staged[name] = values.detach()
+            else:
+                staged[name] = values
+        # The event is recorded after all copies have been issued, hence marks completion of all of them.
+        if staging_buffers is not None:
+            staging_buffers.copy_done.record()
+        self.queue.put((logger, staged, staging_buffers))
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                logger, columns, staging_buffers = item
+                if staging_buffers is not None:
+                    staging_buffers.copy_done.synchronize()
+                records = {name: values.tolist() if isinstance(values, torch.Tensor) else values
+                           for name, values in columns.items()}
+                # The pinned buffers have been read out completely, and can now be used for the next batch.
+                if staging_buffers is not None:
+                    self.free_staging_buffers.put(staging_buffers)
+                logger.add_records(records)
+            except Exception as ex:
+                logging.error(f"Unable to write subject outputs: {ex}")
+                self.error = ex
+            finally:
+                self.queue.task_done()
+
+    def flush(self) -> None:
+        """
+        Waits until all enqueued records have been passed on to their loggers. If writing any of the records failed,
+        the exception is re-raised here.
+        """
+        self._check_not_closed()
+        self.queue.join()
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
+
+    def close(self) -> None:
+        """
+        Writes all pending records, and stops the background thread. After that, no more records can be added.
+        """
+        self.flush()
+        self.is_closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+
 class ScalarLightning(InnerEyeLightning):
     """
     This class implements training of classification, regression, and sequence models with PyTorch Lightning.
@@ -178,7 +355,7 @@ class ScalarLightning(InnerEyeLightning):
         self.model = config.create_model()
         raw_loss = model_util.create_scalar_loss_function(config)
         if isinstance(config, SequenceModelBase):
-            self.loss_fn = lambda model_output, loss: apply_sequence_model_loss(raw_loss, model_output, loss)
+            self.loss_fn = partial(apply_sequence_model_loss, raw_loss)
             self.target_indices = config.get_target_indices()
             self.target_names = [SequenceMetricsDict.get_hue_name_from_target_index(p)
                                  for p in config.sequence_target_positions]
@@ -186,15 +363,26 @@ class ScalarLightning(InnerEyeLightning):
             self.loss_fn = raw_loss
             self.target_indices = []
             self.target_names = config.class_names
+            # Classification and regression models see inputs of a fixed size, hence they can be compiled into a
+            # single graph. Sequence models are not compiled because their input shapes vary from batch to batch.
+            if config.use_torch_compile:
+                model_util.compile_model(self.model, fullgraph=True, dynamic=False, mode="max-autotune")
         self.is_classification_model = config.is_classification_model
         self.use_mean_teacher_model = config.compute_mean_teacher_model
-        self.is_binary_classification_or_regression = True if len(config.class_names) == 1 else False
+        self.is_binary_classification_or_regression = len(config.class_names) == 1
+        # The suffix that is appended to the metric names for each prediction target when logging
+        self._target_suffix = {name: "" if (name == MetricsDict.DEFAULT_HUE_KEY
+                                            or self.is_binary_classification_or_regression) else f"/{name}"
+                               for name in self.target_names}
         self.logits_to_posterior_fn = config.get_post_loss_logits_normalization_function()
         self.loss_type = config.loss_type
         # These two fields store the PyTorch Lightning Metrics objects that will compute metrics on validation
         # and training set, in particular ones that are not possible to compute from a single minibatch (AUC and alike)
         self.train_metric_computers = self.create_metric_computers()
         self.val_metric_computers = self.create_metric_computers()
+        # The same metric computers, flattened into a list that can be iterated over cheaply at each step
+        self._train_metrics_per_target = self._get_metrics_per_target(self.train_metric_computers)
+        self._val_metrics_per_target = self._get_metrics_per_target(self.val_metric_computers)
 
         # if config.compute_grad_cam:
         #     model_to_evaluate = self.train_val_params.mean_teacher_model if \
@@ -213,6 +401,20 @@ class ScalarLightning(InnerEyeLightning):
         # https://github.com/PyTorchLightning/pytorch-lightning/issues/4713
         return ModuleDict({p: self._get_metrics_computers() for p in self.target_names})
 
+    @staticmethod
+    def _get_metrics_per_target(metric_computers: ModuleDict) -> List[Tuple[str, List[Tuple[Metric, bool]]]]:
+        """
+        Converts a dictionary of metric computers to a list of (prediction target, metrics) tuples, where metrics
+        is a list of (metric computer, compute_from_logits) tuples. compute_from_logits is True if the metric must be
+        computed from the model outputs before normalization.
+        :param metric_computers: A dictionary mapping from names of prediction targets to a list of metric computers,
+        as returned by create_metric_computers.
+        """
+        return [(prediction_target,
+                 [(metric, isinstance(metric, ScalarMetricsBase) and metric.compute_from_logits)
+                  for metric in metric_list])
+                for prediction_target, metric_list in metric_computers.items()]
+
     def _get_metrics_computers(self) -> ModuleList:
         """
         Gets the objects that compute metrics for the present kind of models, for a single prediction target.
@@ -253,6 +455,14 @@ class ScalarLightning(InnerEyeLightning):
                                                             fixed_columns=fixed_logger_columns)
         self.val_subject_outputs_logger = DataframeLogger(self.val_metrics_folder / subject_output_file,
                                                           fixed_columns=fixed_logger_columns)
+        self.subject_outputs_writer = SubjectOutputsWriter()
+
+    def on_train_end(self) -> None:
+        """
+        Stops the background thread that writes the per-subject model outputs.
+        """
+        self.subject_outputs_writer.close()
+        super().on_train_end()
 
     def training_or_validation_step(self,
                                     sample: Dict[str, Any],
@@ -268,11 +478,8 @@ class ScalarLightning(InnerEyeLightning):
         """
         model_inputs_and_labels = get_scalar_model_inputs_and_labels(self.model, self.target_indices, sample)
         labels = model_inputs_and_labels.labels
-        if is_training:
-            logits = self.model(*model_inputs_and_labels.model_inputs)
-        else:
-            with torch.no_grad():
-                logits = self.model(*model_inputs_and_labels.model_inputs)
+        # Lightning already disables gradient computation when calling validation_step.
+        logits = self.model(*model_inputs_and_labels.model_inputs)
         subject_ids = model_inputs_and_labels.subject_ids
         loss = self.loss_fn(logits, labels)
         self.write_loss(is_training, loss)
@@ -296,12 +503,17 @@ class ScalarLightning(InnerEyeLightning):
         :param is_training: If True, write the metrics as training metrics, otherwise as validation metrics.
         :return:
         """
-        metrics = self.train_metric_computers if is_training else self.val_metric_computers
-        per_subject_outputs: List[Tuple[str, str, torch.Tensor, torch.Tensor]] = []
-        for i, (prediction_target, metric_list) in enumerate(metrics.items()):
+        metrics_per_target = self._train_metrics_per_target if is_training else self._val_metrics_per_target
+        per_subject_ids: List[str] = []
+        per_subject_targets: List[str] = []
+        per_subject_model_outputs: List[torch.Tensor] = []
+        per_subject_labels: List[torch.Tensor] = []
+        # Split the model outputs and targets into per-target views in one call, rather than indexing in the loop.
+        logits_per_target = logits.unbind(dim=1)
+        targets_per_target = targets.unbind(dim=1)
+        for i, (prediction_target, metric_list) in enumerate(metrics_per_target):
             # mask the model outputs and labels if required
-            masked = get_masked_model_outputs_and_labels(
-                logits[:, i, ...], targets[:, i, ...], subject_ids)
+            masked = get_masked_model_outputs_and_labels(logits_per_target[i], targets_per_target[i], subject_ids)
             # compute metrics on valid masked tensors only
             if masked is not None:
                 _logits = masked.model_outputs.data
@@ -311,26 +523,29 @@ class ScalarLightning(InnerEyeLightning):
                 _labels = masked.labels.data.to(dtype=labels_dtype)
                 _subject_ids = masked.subject_ids
                 assert _subject_ids is not None
-                for metric in metric_list:
-                    if isinstance(metric, ScalarMetricsBase) and metric.compute_from_logits:
-                        metric(_logits, _labels)
-                    else:
-                        metric(_posteriors, _labels)
-                per_subject_outputs.extend(
-                    zip(_subject_ids, [prediction_target] * len(_subject_ids), _posteriors.tolist(), _labels.tolist()))
+                for metric, compute_from_logits in metric_list:
+                    metric(_logits if compute_from_logits else _posteriors, _labels)
+                per_subject_ids.extend(_subject_ids)
+                per_subject_targets.extend([prediction_target] * len(_subject_ids))
+                per_subject_model_outputs.append(_posteriors)
+                per_subject_labels.append(_labels)
         # Write a full breakdown of per-subject predictions and labels to a file. These files are local to the current
-        # rank in distributed training, and will be aggregated after training.
+        # rank in distributed training, and will be aggregated after training. Model outputs and labels for all
+        # prediction targets are concatenated on the device, such that there is only one copy to the CPU per batch,
+        # and converted to lists in a background thread, to avoid waiting for the GPU here.
+        num_records = len(per_subject_ids)
+        if num_records == 0:
+            return
         logger = self.train_subject_outputs_logger if is_training else self.val_subject_outputs_logger
         data_split = ModelExecutionMode.TRAIN if is_training else ModelExecutionMode.VAL
-        for subject, prediction_target, model_output, label in per_subject_outputs:
-            logger.add_record({
-                LoggingColumns.Epoch.value: self.current_epoch,
-                LoggingColumns.Patient.value: subject,
-                LoggingColumns.Hue.value: prediction_target,
-                LoggingColumns.ModelOutput.value: model_output,
-                LoggingColumns.Label.value: label,
-                LoggingColumns.DataSplit.value: data_split.value
-            })
+        self.subject_outputs_writer.add_records(logger, {
+            LoggingColumns.Epoch.value: [self.current_epoch] * num_records,
+            LoggingColumns.Patient.value: per_subject_ids,
+            LoggingColumns.Hue.value: per_subject_targets,
+            LoggingColumns.ModelOutput.value: torch.cat(per_subject_model_outputs),
+            LoggingColumns.Label.value: torch.cat(per_subject_labels),
+            LoggingColumns.DataSplit.value: [data_split.value] * num_records
+        })
 
     def training_or_validation_epoch_end(self, is_training: bool) -> None:
         """
@@ -339,8 +554,7 @@ class ScalarLightning(InnerEyeLightning):
         metric_computers = self.train_metric_computers if is_training else self.val_metric_computers
         prefix = TRAIN_PREFIX if is_training else VALIDATION_PREFIX
         for prediction_target, metric_list in metric_computers.items():
-            target_suffix = "" if (prediction_target == MetricsDict.DEFAULT_HUE_KEY
-                                   or self.is_binary_classification_or_regression) else f"/{prediction_target}"
+            target_suffix = self._target_suffix[prediction_target]
             for metric in metric_list:
                 if metric.has_predictions:
                     # Sequence models can have no predictions at all for particular positions, depending on the data.
@@ -348,6 +562,7 @@ class ScalarLightning(InnerEyeLightning):
                     self.log(name=prefix + metric.name + target_suffix, value=metric.compute())
                     metric.reset()
         logger = self.train_subject_outputs_logger if is_training else self.val_subject_outputs_logger
+        self.subject_outputs_writer.flush()
         logger.flush()
         super().training_or_validation_epoch_end(is_training)
 
@@ -376,7 +591,9 @@ def transfer_batch_to_device(batch: Any, device: torch.device) -> Any:
     items = batch.get("items", None)
     if items is not None and isinstance(items, List) and isinstance(items[0], List) and \
             isinstance(items[0][0], ScalarItem):
-        batch["items"] = [[j.to_device(device) for j in i] for i in items]
+        # Each copy is issued without waiting for the previous ones to complete. The copies are only asynchronous
+        # if the data loader has placed the items in pinned memory.
+        batch["items"] = [[item.to_device(device, non_blocking=True) for item in sequence] for sequence in items]
         return batch
     else:
         return move_data_to_device(batch, device)
@@ -292,15 +292,18 @@ def calculate_metrics_per_class(segmentation: np.ndarray,
 
 def compute_dice_across_patches(segmentation: torch.Tensor,
                                 ground_truth: torch.Tensor,
-                                allow_multiple_classes_for_each_pixel: bool = False) -> torch.Tensor:
+                                allow_multiple_classes_for_each_pixel: bool = False,
+                                skip_background: bool = False) -> torch.Tensor:
     """
     Computes the Dice scores for all classes across all patches in the arguments.
     :param segmentation: Tensor containing class ids predicted by a model.
     :param ground_truth: One-hot encoded torch tensor containing ground-truth label ids.
     :param allow_multiple_classes_for_each_pixel: If set to False, ground-truth tensor has
     to contain only one foreground label for each pixel.
+    :param skip_background: If True, do not compute the Dice score for the background class at index 0.
     :return A torch tensor of size (Patches, Classes) with the Dice scores. Dice scores are computed for
-    all classes including the background class at index 0.
+    all classes including the background class at index 0, unless skip_background is True. In that case, the
+    result has size (Patches, Classes - 1).
     """
     check_size_matches(segmentation, ground_truth, 4, 5, [0, -3, -2, -1],
                        arg1_name="segmentation", arg2_name="ground_truth")
@@ -318,6 +321,9 @@ def compute_dice_across_patches(segmentation: torch.Tensor,
     # Convert the tensors to bool tensors
     one_hot_segmentation = one_hot_segmentation.bool().view(num_patches, num_classes, -1)
     ground_truth = ground_truth.bool().view(num_patches, num_classes, -1)
+    if skip_background:
+        one_hot_segmentation = one_hot_segmentation[:, 1:]
+        ground_truth = ground_truth[:, 1:]
 
     # And operation between segmentation and ground-truth - reduction operation
     # Count the number of samples in segmentation and ground-truth
@@ -799,6 +799,18 @@ class DataframeLogger:
     def add_record(self, record: Dict[str, Any]) -> None:
         self.records.append({**record, **self.fixed_columns})
 
+    def add_records(self, columns: Dict[str, Sequence[Any]]) -> None:
+        """
+        Adds multiple records at once, where the records are given in column format.
+        :param columns: A dictionary mapping from column name to the values in that column, one value per record.
+        All values must have the same length.
+        """
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"All columns must have the same length, but got lengths {lengths}")
+        names = list(columns.keys())
+        self.records.extend({**dict(zip(names, row)), **self.fixed_columns} for row in zip(*columns.values()))
+
     def flush(self, log_info: bool = False) -> None:
         """
         Save the internal records to a csv file.
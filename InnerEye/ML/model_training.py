@@ -12,6 +12,7 @@ import torch
 from pytorch_lightning import Trainer, seed_everything
 from pytorch_lightning.callbacks import ModelCheckpoint
 from pytorch_lightning.loggers import TensorBoardLogger
+from pytorch_lightning.plugins.ddp_plugin import DDPPlugin
 
 from InnerEye.Azure.azure_util import RUN_CONTEXT
 from InnerEye.Common.common_util import SUBJECT_METRICS_FILE_NAME, logging_section
@@ -103,6 +104,11 @@ def create_lightning_trainer(config: ModelConfigBase,
     # For unit tests, only "ddp_spawn" works
     accelerator = "ddp" if num_gpus > 1 else None
     logging.info(f"Using {num_gpus} GPUs with accelerator '{accelerator}'")
+    # Gradients are all-reduced in buckets while the backward pass is still running. The bucket size controls how
+    # well communication and computation overlap.
+    plugins = [DDPPlugin(bucket_cap_mb=config.ddp_bucket_cap_mb,
+                         gradient_as_bucket_view=config.ddp_gradient_as_bucket_view)] \
+        if accelerator == "ddp" else None
     storing_logger = StoringLogger()
     tensorboard_logger = TensorBoardLogger(save_dir=str(config.logs_folder), name="Lightning", version="")
     loggers = [storing_logger, tensorboard_logger, AzureMLLogger()]
@@ -130,6 +136,7 @@ def create_lightning_trainer(config: ModelConfigBase,
                       deterministic=deterministic,
                       benchmark=benchmark,
                       accelerator=accelerator,
+                      plugins=plugins,
                       max_epochs=config.num_epochs,
                       num_sanity_val_steps=config.pl_num_sanity_val_steps,
                       callbacks=[best_checkpoint_callback, recovery_checkpoint_callback],
@@ -13,7 +13,7 @@ from InnerEye.Common.metrics_constants import LoggingColumns
 from InnerEye.ML.dataset.scalar_dataset import ScalarDataset
 from InnerEye.ML.scalar_config import ScalarModelBase
 from InnerEye.ML.reports.classification_report import LabelsAndPredictions, print_metrics, get_labels_and_predictions, \
-    get_metric, ReportedMetrics
+    get_metric, ReportedMetrics, read_csv_cached
 from InnerEye.ML.reports.notebook_report import print_header
 
 
@@ -121,7 +121,7 @@ def get_labels_and_predictions_for_prediction_target_set(csv: Path,
     NOTE: This CSV file should have results from a single epoch, as in the metrics files written during inference, not
     like the ones written while training.
     """
-    metrics_df = pd.read_csv(csv)
+    metrics_df = read_csv_cached(csv)
     df = get_dataframe_with_exact_label_matches(metrics_df=metrics_df,
                                                 prediction_target_set_to_match=prediction_target_set_to_match,
                                                 all_prediction_targets=all_prediction_targets,
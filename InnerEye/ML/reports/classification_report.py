@@ -6,8 +6,9 @@ import math
 import torch
 from dataclasses import dataclass
 from enum import Enum
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -15,17 +16,26 @@ import pandas as pd
 from IPython.display import display
 from PIL import Image
 from matplotlib.axes import Axes
-from sklearn.metrics import auc, precision_recall_curve, recall_score, roc_auc_score, roc_curve
+from sklearn.metrics import auc, precision_recall_curve, roc_curve
 
 from InnerEye.Common.metrics_constants import LoggingColumns
-from InnerEye.ML.metrics_dict import MetricsDict, binary_classification_accuracy
+from InnerEye.ML.metrics_dict import MetricsDict
 from InnerEye.ML.reports.notebook_report import print_header
 from InnerEye.ML.utils.io_util import load_image_in_known_formats
 from InnerEye.ML.scalar_config import ScalarModelBase
 from InnerEye.ML.dataset.scalar_dataset import ScalarDataset
+from InnerEye.ML.dataset.scalar_sample import ScalarDataSource
 
+try:
+    import numba
+except ImportError:
+    numba = None  # type: ignore
 
-@dataclass
+# The maximum number of points on a curve for which plot_auc prints the coordinates
+MAX_ANNOTATED_POINTS = 20
+
+
+@dataclass(frozen=True)
 class LabelsAndPredictions:
     subject_ids: np.ndarray
     labels: np.ndarray
@@ -52,6 +62,44 @@ class ReportedMetrics(Enum):
     FalseNegativeRate = "false_negative_rate"
 
 
+# The columns of the metrics files that are needed to compute metrics for a single prediction target, and the types
+# they are parsed as. The subject IDs are not given a type, so that they keep the type that pandas infers for them.
+METRICS_CSV_COLUMNS = (LoggingColumns.Hue.value, LoggingColumns.Patient.value, LoggingColumns.Label.value,
+                       LoggingColumns.ModelOutput.value)
+METRICS_CSV_DTYPES = {LoggingColumns.Hue.value: str,
+                      LoggingColumns.Label.value: np.float32,
+                      LoggingColumns.ModelOutput.value: np.float32}
+
+
+@lru_cache(maxsize=8)
+def _read_csv_cached(csv: str, modification_time_ns: int, file_size: int, read_as_str: bool,
+                     columns: Optional[Tuple[str, ...]]) -> pd.DataFrame:
+    """
+    Reads a csv file. The modification time and size of the file are only used as part of the cache key.
+    """
+    if read_as_str:
+        dtype: Any = str
+    elif columns is not None:
+        dtype = {column: METRICS_CSV_DTYPES[column] for column in columns if column in METRICS_CSV_DTYPES}
+    else:
+        dtype = None
+    return pd.read_csv(csv, dtype=dtype, usecols=list(columns) if columns is not None else None)
+
+
+def read_csv_cached(csv: Path, read_as_str: bool = False, columns: Optional[Tuple[str, ...]] = None) -> pd.DataFrame:
+    """
+    Reads one of the csv files written during inference time. The report reads the same files many times, hence the
+    result is cached, and only read again if the file has been modified. The returned dataframe is shared between
+    all callers, and must not be modified.
+    :param csv: The csv file to read.
+    :param read_as_str: If True, read all columns as strings. If False, let pandas infer the column types.
+    :param columns: If provided, only read these columns from the file. Columns listed in METRICS_CSV_DTYPES are
+    parsed with the type given there, rather than the type inferred by pandas.
+    """
+    stat = csv.stat()
+    return _read_csv_cached(str(csv.resolve()), stat.st_mtime_ns, stat.st_size, read_as_str, columns)
+
+
 def read_csv_and_filter_prediction_target(csv: Path, prediction_target: str) -> pd.DataFrame:
     """
     Given one of the csv files written during inference time, read it and select only those rows which belong to the
@@ -59,7 +107,7 @@ def read_csv_and_filter_prediction_target(csv: Path, prediction_target: str) ->
     The csv must have at least the following columns (defined in the LoggingColumns enum):
     LoggingColumns.Hue, LoggingColumns.Patient.
     """
-    df = pd.read_csv(csv)
+    df = read_csv_cached(csv, columns=METRICS_CSV_COLUMNS)
     df = df[df[LoggingColumns.Hue.value] == prediction_target]  # Filter by prediction target
     if not df[LoggingColumns.Patient.value].is_unique:
         raise ValueError(f"Subject IDs should be unique, but found duplicate entries "
@@ -78,32 +126,159 @@ def get_labels_and_predictions(csv: Path, prediction_target: str) -> LabelsAndPr
 
     """
     df = read_csv_and_filter_prediction_target(csv, prediction_target)
-    labels = df[LoggingColumns.Label.value].to_numpy()
-    model_outputs = df[LoggingColumns.ModelOutput.value].to_numpy()
+    # Single precision is sufficient for thresholding and computing ROC and PR curves, and halves the memory traffic.
+    # The labels are binary, and are stored in a single byte each. Missing labels must be caught before the cast,
+    # because NaN has no integer representation.
+    if df[LoggingColumns.Label.value].isna().any():
+        raise ValueError(f"Labels should not be missing, but found empty entries in column "
+                         f"{LoggingColumns.Label.value} in the csv file.")
+    labels = df[LoggingColumns.Label.value].to_numpy(dtype=np.int8, copy=False)
+    model_outputs = df[LoggingColumns.ModelOutput.value].to_numpy(dtype=np.float32, copy=False)
     subjects = df[LoggingColumns.Patient.value].to_numpy()
     return LabelsAndPredictions(subject_ids=subjects, labels=labels, model_outputs=model_outputs)
 
 
+def drop_collinear_points(x_values: np.ndarray, y_values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Removes all points from a curve that lie on the straight line between their neighbours, and hence do not change
+    the shape of the curve when plotted. The first and last points are always kept.
+    :param x_values: x coordinate of each point of the curve
+    :param y_values: y coordinate of each point of the curve
+    :return: A tuple of (x, y) coordinates of the points that are kept.
+    """
+    if len(x_values) < 3:
+        return x_values, y_values
+    dx = np.diff(x_values)
+    dy = np.diff(y_values)
+    # A point can be dropped if the segments before and after it point in the same direction.
+    cross = dx[:-1] * dy[1:] - dy[:-1] * dx[1:]
+    dot = dx[:-1] * dx[1:] + dy[:-1] * dy[1:]
+    is_corner = (np.abs(cross) > 1e-12) | (dot < 0)
+    keep = np.concatenate(([True], is_corner, [True]))
+    return x_values[keep], y_values[keep]
+
+
 def plot_auc(x_values: np.ndarray, y_values: np.ndarray, title: str, ax: Axes, print_coords: bool = False) -> None:
     """
-    Plot a curve given the x and y values of each point.
+    Plot a curve given the x and y values of each point. Points that do not change the shape of the curve are not
+    plotted.
     :param x_values: x coordinate of each data point to be plotted
     :param y_values: y coordinate of each data point to be plotted
     :param title: Title of the plot
     :param ax: matplotlib.axes.Axes object for plotting
-    :param print_coords: If true, prints out the coordinates of each point on the graph.
+    :param print_coords: If true, prints out the coordinates of points on the graph, for at most about
+    MAX_ANNOTATED_POINTS evenly spaced points.
     """
+    x_values, y_values = drop_collinear_points(x_values, y_values)
     ax.plot(x_values, y_values)
     ax.set_xlim(left=0, right=1)
     ax.set_ylim(bottom=0, top=1)
     ax.set_title(title)
 
     if print_coords:
-        # write values of points
-        for x, y in zip(x_values, y_values):
+        # write values of points. Annotations are expensive to draw, and would overlap for long curves, hence only
+        # write the values for a limited number of evenly spaced points.
+        step = max(1, len(x_values) // MAX_ANNOTATED_POINTS)
+        for x, y in zip(x_values[::step], y_values[::step]):
             ax.annotate(f"{x:0.3f}, {y:0.3f}", xy=(x, y), xytext=(15, 0), textcoords='offset points')
 
 
+@dataclass
+class ROCAndPRCurves:
+    """
+    The ROC and PR curves for a set of binary labels and model outputs, in the same format as returned by roc_curve
+    (with drop_intermediate=True) and precision_recall_curve in sklearn 0.23.
+    """
+    fpr: np.ndarray
+    tpr: np.ndarray
+    roc_thresholds: np.ndarray
+    precision: np.ndarray
+    recall: np.ndarray
+    pr_thresholds: np.ndarray
+
+
+def get_positive_counts_at_distinct_values(sorted_outputs: np.ndarray,
+                                           sorted_labels: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Given model outputs sorted in decreasing order and the corresponding binary labels, computes the number of true
+    positives and false positives when thresholding at each distinct model output. This is done in a single pass over
+    the data, and compiled with numba if that is installed.
+    :param sorted_outputs: The model outputs, sorted in decreasing order.
+    :param sorted_labels: A boolean array, True for all model outputs that belong to the positive class.
+    :return: A tuple of (true positives, false positives, indices), each with one entry per distinct model output.
+    The indices point to the last entry in the sorted model outputs with the given value.
+    """
+    n = sorted_outputs.shape[0]
+    tps = np.empty(n, dtype=np.int64)
+    fps = np.empty(n, dtype=np.int64)
+    idxs = np.empty(n, dtype=np.int64)
+    num_distinct = 0
+    true_positives = 0
+    for i in range(n):
+        if sorted_labels[i]:
+            true_positives += 1
+        if i == n - 1 or sorted_outputs[i] != sorted_outputs[i + 1]:
+            tps[num_distinct] = true_positives
+            fps[num_distinct] = i + 1 - true_positives
+            idxs[num_distinct] = i
+            num_distinct += 1
+    return tps[:num_distinct], fps[:num_distinct], idxs[:num_distinct]
+
+
+if numba is not None:
+    # Compilation adds about a second to the first call, which only pays off for large numbers of model outputs in a
+    # report that runs once. With cache=True, the compiled code is stored on disk and re-used by later reports.
+    get_positive_counts_at_distinct_values = numba.njit(cache=True)(  # type: ignore
+        get_positive_counts_at_distinct_values)
+
+
+def get_roc_and_pr_curves(labels: np.ndarray, model_outputs: np.ndarray) -> ROCAndPRCurves:
+    """
+    Computes the ROC and the PR curve for the given labels and model outputs. The model outputs are sorted only once,
+    and both curves are derived from the cumulative counts of true and false positives at each distinct model output.
+    The results match sklearn 0.23 (the pinned version) roc_curve (with drop_intermediate=True) and
+    precision_recall_curve, which would each sort the model outputs. That includes the first ROC threshold, which is
+    the largest model output plus 1, and the PR curve ending at the first point with full recall. Later versions of
+    sklearn may differ in those details.
+    If numba is not installed, the curves are computed by sklearn directly, because the counting loop would be slow
+    in plain Python.
+    :param labels: The ground truth labels, with 1 for the positive class and 0 for the negative class.
+    :param model_outputs: The model outputs.
+    """
+    if numba is None:
+        fpr, tpr, roc_thresholds = roc_curve(labels, model_outputs)
+        precision, recall, pr_thresholds = precision_recall_curve(labels, model_outputs)
+        return ROCAndPRCurves(fpr=fpr, tpr=tpr, roc_thresholds=roc_thresholds,
+                              precision=precision, recall=recall, pr_thresholds=pr_thresholds)
+    order = np.argsort(model_outputs, kind="mergesort")[::-1]
+    sorted_outputs = np.ascontiguousarray(model_outputs[order])
+    sorted_labels = np.ascontiguousarray(labels[order] == 1)
+    tps, fps, threshold_idxs = get_positive_counts_at_distinct_values(sorted_outputs, sorted_labels)
+    thresholds = sorted_outputs[threshold_idxs]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # PR curve, in order of increasing threshold, starting at the point where full recall is reached
+        precision = tps / (tps + fps)
+        recall = tps / tps[-1]
+        last_ind = tps.searchsorted(tps[-1])
+        pr_slice = slice(last_ind, None, -1)
+        # ROC curve: Drop points that are collinear with their neighbours, and add a point at (0, 0)
+        if len(fps) > 2:
+            optimal_idxs = np.where(np.r_[True, np.logical_or(np.diff(fps, 2), np.diff(tps, 2)), True])[0]
+            fps, tps, thresholds = fps[optimal_idxs], tps[optimal_idxs], thresholds[optimal_idxs]
+        tps = np.r_[0, tps]
+        fps = np.r_[0, fps]
+        roc_thresholds = np.r_[thresholds[0] + 1, thresholds]
+        fpr = fps / fps[-1]
+        tpr = tps / tps[-1]
+    return ROCAndPRCurves(fpr=fpr,
+                          tpr=tpr,
+                          roc_thresholds=roc_thresholds,
+                          precision=np.r_[precision[pr_slice], 1],
+                          recall=np.r_[recall[pr_slice], 0],
+                          pr_thresholds=sorted_outputs[threshold_idxs][pr_slice])
+
+
 def plot_pr_and_roc_curves(labels_and_model_outputs: LabelsAndPredictions) -> None:
     """
     Given a LabelsAndPredictions object, plot the ROC and PR curves.
@@ -111,12 +286,9 @@ def plot_pr_and_roc_curves(labels_and_model_outputs: LabelsAndPredictions) -> No
     print_header("ROC and PR curves", level=3)
     _, ax = plt.subplots(1, 2)
 
-    fpr, tpr, thresholds = roc_curve(labels_and_model_outputs.labels, labels_and_model_outputs.model_outputs)
-
-    plot_auc(fpr, tpr, "ROC Curve", ax[0])
-    precision, recall, thresholds = precision_recall_curve(labels_and_model_outputs.labels,
-                                                           labels_and_model_outputs.model_outputs)
-    plot_auc(recall, precision, "PR Curve", ax[1])
+    curves = get_roc_and_pr_curves(labels_and_model_outputs.labels, labels_and_model_outputs.model_outputs)
+    plot_auc(curves.fpr, curves.tpr, "ROC Curve", ax[0])
+    plot_auc(curves.recall, curves.precision, "PR Curve", ax[1])
 
     plt.show()
 
@@ -132,6 +304,53 @@ def plot_pr_and_roc_curves_from_csv(metrics_csv: Path, config: ScalarModelBase)
         plot_pr_and_roc_curves(metrics)
 
 
+def only_one_class_present(labels: np.ndarray) -> bool:
+    """
+    Returns True if all the given labels have the same value, in which case the ROC and PR curves are not defined.
+    """
+    return labels.size < 2 or labels.min() == labels.max()
+
+
+def get_optimal_threshold(labels: np.ndarray, model_outputs: np.ndarray) -> float:
+    """
+    Given ground truth labels and model outputs, return the threshold for classification that is optimal on the
+    ROC curve.
+    """
+    curves = get_roc_and_pr_curves(labels, model_outputs)
+    optimal_idx = MetricsDict.get_optimal_idx(fpr=curves.fpr, tpr=curves.tpr)
+    return curves.roc_thresholds[optimal_idx]
+
+
+def get_metrics_at_threshold(labels: np.ndarray,
+                             model_outputs: np.ndarray,
+                             threshold: float) -> Tuple[float, float, float]:
+    """
+    Computes accuracy, false positive rate and false negative rate when predicting the positive class for all model
+    outputs at or above the threshold. All three metrics are derived from the counts of true and false positives and
+    negatives, which are computed in a single pass over the data.
+    :param labels: The ground truth labels. Labels above 0.5 are treated as positive.
+    :param model_outputs: The model outputs.
+    :param threshold: The threshold for classification.
+    :return: A tuple of (accuracy, false positive rate, false negative rate)
+    """
+    # Outputs at the threshold count as positive, as in the ROC curve. Note that the training-time metric
+    # AccuracyAtOptimalThreshold in lightning_metrics uses a strict comparison, hence its accuracy can differ.
+    predicted_positive = model_outputs >= threshold
+    label_positive = labels > 0.5
+    true_positives = np.count_nonzero(predicted_positive & label_positive)
+    false_positives = np.count_nonzero(predicted_positive) - true_positives
+    false_negatives = np.count_nonzero(label_positive) - true_positives
+    true_negatives = len(labels) - true_positives - false_positives - false_negatives
+    accuracy = (true_positives + true_negatives) / len(labels)
+    # As in sklearn's recall_score, the true negative and true positive rates are 0 if there are no negative or
+    # positive labels, respectively.
+    num_negatives = true_negatives + false_positives
+    num_positives = true_positives + false_negatives
+    false_positive_rate = 1 - (true_negatives / num_negatives if num_negatives > 0 else 0.0)
+    false_negative_rate = 1 - (true_positives / num_positives if num_positives > 0 else 0.0)
+    return accuracy, false_positive_rate, false_negative_rate
+
+
 def get_metric(val_labels_and_predictions: LabelsAndPredictions,
                test_labels_and_predictions: LabelsAndPredictions,
                metric: ReportedMetrics,
@@ -142,36 +361,34 @@ def get_metric(val_labels_and_predictions: LabelsAndPredictions,
     optimal threshold for classification.
     :param test_labels_and_predictions: The set of labels and model outputs to calculate metrics for.
     :param metric: The name of the metric to calculate.
-    :param optimal_threshold: If provided, use this threshold instead of calculating an optimal threshold.
+    :param optimal_threshold: If provided, use this threshold instead of calculating an optimal threshold. When
+    computing several metrics for the same data, pass in the result of get_optimal_threshold, to avoid computing the
+    ROC curve of the validation set again for each metric.
     """
-    if not optimal_threshold:
-        fpr, tpr, thresholds = roc_curve(val_labels_and_predictions.labels, val_labels_and_predictions.model_outputs)
-        optimal_idx = MetricsDict.get_optimal_idx(fpr=fpr, tpr=tpr)
-        optimal_threshold = thresholds[optimal_idx]
+    # The AUC metrics only depend on the test set, hence there is no need to compute the optimal threshold for them.
+    if metric is ReportedMetrics.AUC_ROC or metric is ReportedMetrics.AUC_PR:
+        if only_one_class_present(test_labels_and_predictions.labels):
+            return math.nan
+        curves = get_roc_and_pr_curves(test_labels_and_predictions.labels, test_labels_and_predictions.model_outputs)
+        if metric is ReportedMetrics.AUC_ROC:
+            return auc(curves.fpr, curves.tpr)
+        return auc(curves.recall, curves.precision)
 
-    assert optimal_threshold  # for mypy, we have already calculated optimal threshold if it was set to None
+    if optimal_threshold is None:
+        optimal_threshold = get_optimal_threshold(val_labels_and_predictions.labels,
+                                                  val_labels_and_predictions.model_outputs)
 
     if metric is ReportedMetrics.OptimalThreshold:
         return optimal_threshold
-
-    only_one_class_present = len(set(test_labels_and_predictions.labels)) < 2
-
-    if metric is ReportedMetrics.AUC_ROC:
-        return math.nan if only_one_class_present else roc_auc_score(test_labels_and_predictions.labels, test_labels_and_predictions.model_outputs)
-    elif metric is ReportedMetrics.AUC_PR:
-        if only_one_class_present:
-            return math.nan
-        precision, recall, _ = precision_recall_curve(test_labels_and_predictions.labels, test_labels_and_predictions.model_outputs)
-        return auc(recall, precision)
-    elif metric is ReportedMetrics.Accuracy:
-        return binary_classification_accuracy(model_output=test_labels_and_predictions.model_outputs,
-                                              label=test_labels_and_predictions.labels,
-                                              threshold=optimal_threshold)
+    accuracy, fpr, fnr = get_metrics_at_threshold(labels=test_labels_and_predictions.labels,
+                                                  model_outputs=test_labels_and_predictions.model_outputs,
+                                                  threshold=optimal_threshold)
+    if metric is ReportedMetrics.Accuracy:
+        return accuracy
     elif metric is ReportedMetrics.FalsePositiveRate:
-        tnr = recall_score(test_labels_and_predictions.labels, test_labels_and_predictions.model_outputs >= optimal_threshold, pos_label=0)
-        return 1 - tnr
+        return fpr
     elif metric is ReportedMetrics.FalseNegativeRate:
-        return 1 - recall_score(test_labels_and_predictions.labels, test_labels_and_predictions.model_outputs >= optimal_threshold)
+        return fnr
     else:
         raise ValueError("Unknown metric")
 
@@ -190,41 +407,29 @@ def print_metrics(val_labels_and_predictions: LabelsAndPredictions,
     :return:
     """
 
-    optimal_threshold = 0.5 if is_thresholded else None
+    # The ROC curve on the validation set is only computed once, and the threshold is re-used for all metrics.
+    optimal_threshold = 0.5 if is_thresholded else get_optimal_threshold(val_labels_and_predictions.labels,
+                                                                         val_labels_and_predictions.model_outputs)
 
     if not is_thresholded:
-        roc_auc = get_metric(val_labels_and_predictions=val_labels_and_predictions,
-                             test_labels_and_predictions=test_labels_and_predictions,
-                             metric=ReportedMetrics.AUC_ROC)
+        if only_one_class_present(test_labels_and_predictions.labels):
+            roc_auc = pr_auc = math.nan
+        else:
+            # Both AUCs are computed from the same sorted model outputs
+            curves = get_roc_and_pr_curves(test_labels_and_predictions.labels,
+                                           test_labels_and_predictions.model_outputs)
+            roc_auc = auc(curves.fpr, curves.tpr)
+            pr_auc = auc(curves.recall, curves.precision)
         print_header(f"Area under ROC Curve: {roc_auc:.4f}", level=4)
-
-        pr_auc = get_metric(val_labels_and_predictions=val_labels_and_predictions,
-                            test_labels_and_predictions=test_labels_and_predictions,
-                            metric=ReportedMetrics.AUC_PR)
         print_header(f"Area under PR Curve: {pr_auc:.4f}", level=4)
 
-        optimal_threshold = get_metric(val_labels_and_predictions=val_labels_and_predictions,
-                                       test_labels_and_predictions=test_labels_and_predictions,
-                                       metric=ReportedMetrics.OptimalThreshold)
-
         print_header(f"Optimal threshold: {optimal_threshold: .4f}", level=4)
 
-    accuracy = get_metric(val_labels_and_predictions=val_labels_and_predictions,
-                          test_labels_and_predictions=test_labels_and_predictions,
-                          metric=ReportedMetrics.Accuracy,
-                          optimal_threshold=optimal_threshold)
+    accuracy, fpr, fnr = get_metrics_at_threshold(labels=test_labels_and_predictions.labels,
+                                                  model_outputs=test_labels_and_predictions.model_outputs,
+                                                  threshold=optimal_threshold)
     print_header(f"Accuracy at optimal threshold: {accuracy:.4f}", level=4)
-
-    fpr = get_metric(val_labels_and_predictions=val_labels_and_predictions,
-                     test_labels_and_predictions=test_labels_and_predictions,
-                     metric=ReportedMetrics.FalsePositiveRate,
-                     optimal_threshold=optimal_threshold)
     print_header(f"Specificity at optimal threshold: {1 - fpr:.4f}", level=4)
-
-    fnr = get_metric(val_labels_and_predictions=val_labels_and_predictions,
-                     test_labels_and_predictions=test_labels_and_predictions,
-                     metric=ReportedMetrics.FalseNegativeRate,
-                     optimal_threshold=optimal_threshold)
     print_header(f"Sensitivity at optimal threshold: {1 - fnr:.4f}", level=4)
     print_header("", level=4)
 
@@ -265,19 +470,21 @@ def get_correct_and_misclassified_examples(val_metrics_csv: Path, test_metrics_c
     """
     df_val = read_csv_and_filter_prediction_target(val_metrics_csv, prediction_target)
 
-    fpr, tpr, thresholds = roc_curve(df_val[LoggingColumns.Label.value], df_val[LoggingColumns.ModelOutput.value])
-    optimal_idx = MetricsDict.get_optimal_idx(fpr=fpr, tpr=tpr)
-    optimal_threshold = thresholds[optimal_idx]
+    optimal_threshold = get_optimal_threshold(df_val[LoggingColumns.Label.value].to_numpy(),
+                                              df_val[LoggingColumns.ModelOutput.value].to_numpy())
 
     df_test = read_csv_and_filter_prediction_target(test_metrics_csv, prediction_target)
 
-    df_test["predicted"] = df_test.apply(lambda x: int(x[LoggingColumns.ModelOutput.value] >= optimal_threshold),
-                                         axis=1)
+    df_test["predicted"] = (df_test[LoggingColumns.ModelOutput.value].to_numpy() >= optimal_threshold).astype(int)
 
-    true_positives = df_test[(df_test["predicted"] == 1) & (df_test[LoggingColumns.Label.value] == 1)]
-    false_positives = df_test[(df_test["predicted"] == 1) & (df_test[LoggingColumns.Label.value] == 0)]
-    false_negatives = df_test[(df_test["predicted"] == 0) & (df_test[LoggingColumns.Label.value] == 1)]
-    true_negatives = df_test[(df_test["predicted"] == 0) & (df_test[LoggingColumns.Label.value] == 0)]
+    # Split the test set into all combinations of (predicted, label) in a single pass. Combinations that do not occur
+    # in the data are returned as empty dataframes.
+    groups = dict(list(df_test.groupby(["predicted", LoggingColumns.Label.value], sort=False)))
+    empty = df_test.iloc[0:0]
+    true_positives = groups.get((1, 1), empty)
+    false_positives = groups.get((1, 0), empty)
+    false_negatives = groups.get((0, 1), empty)
+    true_negatives = groups.get((0, 0), empty)
 
     return Results(true_positives=true_positives,
                    true_negatives=true_negatives,
@@ -295,16 +502,19 @@ def get_k_best_and_worst_performing(val_metrics_csv: Path, test_metrics_csv: Pat
                                                      test_metrics_csv=test_metrics_csv,
                                                      prediction_target=prediction_target)
 
-    # sort by model_output
-    sorted = Results(true_positives=results.true_positives.sort_values(by=LoggingColumns.ModelOutput.value,
-                                                                       ascending=False).head(k),
-                     true_negatives=results.true_negatives.sort_values(by=LoggingColumns.ModelOutput.value,
-                                                                       ascending=True).head(k),
-                     false_positives=results.false_positives.sort_values(by=LoggingColumns.ModelOutput.value,
-                                                                         ascending=False).head(k),
-                     false_negatives=results.false_negatives.sort_values(by=LoggingColumns.ModelOutput.value,
-                                                                         ascending=True).head(k))
-    return sorted
+    # select the k largest or smallest model outputs, without sorting the full dataframes
+    model_output = LoggingColumns.ModelOutput.value
+    return Results(true_positives=results.true_positives.nlargest(k, model_output),
+                   true_negatives=results.true_negatives.nsmallest(k, model_output),
+                   false_positives=results.false_positives.nlargest(k, model_output),
+                   false_negatives=results.false_negatives.nsmallest(k, model_output))
+
+
+def iterate_subjects_and_model_outputs(df: pd.DataFrame) -> Iterator[Tuple[Any, float]]:
+    """
+    Iterates over the rows of a dataframe with per-subject results, returning tuples of (subject ID, model output).
+    """
+    return df[[LoggingColumns.Patient.value, LoggingColumns.ModelOutput.value]].itertuples(index=False, name=None)
 
 
 def print_k_best_and_worst_performing(val_metrics_csv: Path, test_metrics_csv: Path, k: int, prediction_target: str) -> None:
@@ -325,64 +535,87 @@ def print_k_best_and_worst_performing(val_metrics_csv: Path, test_metrics_csv: P
                                               prediction_target=prediction_target)
 
     print_header(f"Top {k} false positives", level=2)
-    for index, (subject, model_output) in enumerate(zip(results.false_positives[LoggingColumns.Patient.value],
-                                                        results.false_positives[LoggingColumns.ModelOutput.value])):
+    for index, (subject, model_output) in enumerate(iterate_subjects_and_model_outputs(results.false_positives)):
         print_header(f"{index + 1}. ID {subject} Score: {model_output:.5f}", level=4)
 
     print_header(f"Top {k} false negatives", level=2)
-    for index, (subject, model_output) in enumerate(zip(results.false_negatives[LoggingColumns.Patient.value],
-                                                        results.false_negatives[LoggingColumns.ModelOutput.value])):
+    for index, (subject, model_output) in enumerate(iterate_subjects_and_model_outputs(results.false_negatives)):
         print_header(f"{index + 1}. ID {subject} Score: {model_output:.5f}", level=4)
 
     print_header(f"Top {k} true positives", level=2)
-    for index, (subject, model_output) in enumerate(zip(results.true_positives[LoggingColumns.Patient.value],
-                                                        results.true_positives[LoggingColumns.ModelOutput.value])):
+    for index, (subject, model_output) in enumerate(iterate_subjects_and_model_outputs(results.true_positives)):
         print_header(f"{index + 1}. ID {subject} Score: {model_output:.5f}", level=4)
 
     print_header(f"Top {k} true negatives", level=2)
-    for index, (subject, model_output) in enumerate(zip(results.true_negatives[LoggingColumns.Patient.value],
-                                                        results.true_negatives[LoggingColumns.ModelOutput.value])):
+    for index, (subject, model_output) in enumerate(iterate_subjects_and_model_outputs(results.true_negatives)):
         print_header(f"{index + 1}. ID {subject} Score: {model_output:.5f}", level=4)
 
 
+def get_subject_index(dataset: ScalarDataset) -> Dict[str, ScalarDataSource]:
+    """
+    Builds a lookup table from subject ID to the dataset item for that subject, so that repeated lookups do not need
+    to scan all items in the dataset. If a subject appears more than once, the first item is used.
+    :param dataset: scalar dataset object
+    :return: Dictionary mapping from subject ID to dataset item.
+    """
+    subject_index: Dict[str, ScalarDataSource] = {}
+    for item in dataset.items:
+        subject_index.setdefault(item.metadata.id, item)
+    return subject_index
+
+
+def get_dataset_item_from_subject_id(subject_id: str,
+                                     dataset: ScalarDataset,
+                                     subject_index: Optional[Dict[str, ScalarDataSource]] = None) \
+        -> ScalarDataSource:
+    """
+    Return the dataset item for a subject. If the subject is not found, raises a ValueError.
+    :param subject_id: Subject to retrieve the item for
+    :param dataset: scalar dataset object
+    :param subject_index: Optional lookup table, as created by get_subject_index. If not provided, the items of the
+    dataset are searched one by one.
+    :return: The dataset item for the subject.
+    """
+    if subject_index is not None:
+        item = subject_index.get(subject_id)
+    else:
+        item = next((item for item in dataset.items if item.metadata.id == subject_id), None)
+    if item is None:
+        raise ValueError(f"Could not find subject {subject_id} in the dataset.")
+    return item
+
+
 def get_image_filepath_from_subject_id(subject_id: str,
                                        dataset: ScalarDataset,
-                                       config: ScalarModelBase) -> List[Path]:
+                                       config: ScalarModelBase,
+                                       subject_index: Optional[Dict[str, ScalarDataSource]] = None) -> List[Path]:
     """
     Return the filepaths for images associated with a subject. If the subject is not found, raises a ValueError.
     :param subject_id: Subject to retrive image for
     :param dataset: scalar dataset object
     :param config: model config
+    :param subject_index: Optional lookup table from subject ID to dataset item, as created by get_subject_index.
     :return: List of paths to the image files for the patient.
     """
-    for item in dataset.items:
-        if item.metadata.id == subject_id:
-            return item.get_all_image_filepaths(root_path=config.local_dataset,
-                                                file_mapping=dataset.file_to_full_path)
-
-    raise ValueError(f"Could not find subject {subject_id} in the dataset.")
+    item = get_dataset_item_from_subject_id(subject_id, dataset, subject_index)
+    return item.get_all_image_filepaths(root_path=config.local_dataset,
+                                        file_mapping=dataset.file_to_full_path)
 
 
 def get_image_labels_from_subject_id(subject_id: str,
                                      dataset: ScalarDataset,
-                                     config: ScalarModelBase) -> List[str]:
+                                     config: ScalarModelBase,
+                                     subject_index: Optional[Dict[str, ScalarDataSource]] = None) -> List[str]:
     """
     Return the ground truth labels associated with a subject. If the subject is not found, raises a ValueError.
     :param subject_id: Subject to retrive image for
     :param dataset: scalar dataset object
     :param config: model config
+    :param subject_index: Optional lookup table from subject ID to dataset item, as created by get_subject_index.
     :return: List of labels for the patient.
     """
-    labels = None
-
-    for item in dataset.items:
-        if item.metadata.id == subject_id:
-            labels = torch.flatten(torch.nonzero(item.label)).tolist()
-            break
-
-    if labels is None:
-        raise ValueError(f"Could not find subject {subject_id} in the dataset.")
-
+    item = get_dataset_item_from_subject_id(subject_id, dataset, subject_index)
+    labels = torch.flatten(torch.nonzero(item.label)).tolist()
     return [config.class_names[int(label)] for label in labels
             if not math.isnan(label)]
 
@@ -394,8 +627,8 @@ def get_image_outputs_from_subject_id(subject_id: str,
     """
 
     filtered = metrics_df[metrics_df[LoggingColumns.Patient.value] == subject_id]
-    outputs = list(zip(filtered[LoggingColumns.Hue.value].values.tolist(),
-                       filtered[LoggingColumns.ModelOutput.value].values.astype(float).tolist()))
+    outputs = list(zip(filtered[LoggingColumns.Hue.value].tolist(),
+                       filtered[LoggingColumns.ModelOutput.value].to_numpy(dtype=float).tolist()))
     return outputs
 
 
@@ -415,17 +648,22 @@ def plot_image_from_filepath(filepath: Path, im_width: int) -> bool:
     if image.ndim == 3 and image.shape[0] == 1:
         image = image.squeeze(0)
 
-    # normalize to make sure pixels are plottable
-    min = image.min()
-    max = image.max()
-    image = (image - min) / (max - min)
-
-    image = image * 255.
-    image = np.repeat(image[:, :, None], 3, 2)
-    image = image.astype(np.uint8)
-    h, w = image.shape[:2]
+    h, w = image.shape
     im_height = int(im_width * h / w)
-    display(Image.fromarray(image).resize((im_width, im_height)))
+    # Images that are much larger than the display size are first decimated by an integer stride, such that the
+    # result is still at least twice the display size. Box resampling then averages the remaining pixels.
+    stride = max(1, min(h, w) // (im_width * 2))
+    if stride > 1:
+        image = image[::stride, ::stride]
+
+    # normalize to make sure pixels are plottable: Shift and scale to [0, 255] in a single pass over the image.
+    # Images with a single value (max == min) are shown as all black.
+    min_value = image.min()
+    scale = 255. / max(image.max() - min_value, 1e-12)
+    image = ((image - min_value) * scale).astype(np.uint8)
+    # Display as a single channel greyscale image, rather than replicating the pixel values for 3 RGB channels.
+    # Box resampling is only SIMD-accelerated if Pillow-SIMD is installed in place of Pillow.
+    display(Image.fromarray(image, mode="L").resize((im_width, im_height), resample=Image.BOX))
     return True
 
 
@@ -435,7 +673,8 @@ def plot_image_for_subject(subject_id: str,
                            model_output: float,
                            header: Optional[str],
                            config: ScalarModelBase,
-                           metrics_df: Optional[pd.DataFrame] = None) -> None:
+                           metrics_df: Optional[pd.DataFrame] = None,
+                           subject_index: Optional[Dict[str, ScalarDataSource]] = None) -> None:
     """
     Given a subject ID, plots the corresponding image.
     :param subject_id: Subject to plot image for
@@ -444,7 +683,9 @@ def plot_image_for_subject(subject_id: str,
     :param model_output: The predicted value for this image
     :param header: Optional header printed along with the subject ID and score for the image.
     :param config: model config
-    :param metrics_df: dataframe with the metrics written out during inference time
+    :param metrics_df: dataframe with the metrics written out during inference time. It is sufficient to pass only
+    the rows for the given subject.
+    :param subject_index: Optional lookup table from subject ID to dataset item, as created by get_subject_index.
     """
     print_header("", level=4)
     if header:
@@ -452,7 +693,8 @@ def plot_image_for_subject(subject_id: str,
 
     labels = get_image_labels_from_subject_id(subject_id=subject_id,
                                               dataset=dataset,
-                                              config=config)
+                                              config=config,
+                                              subject_index=subject_index)
 
     print_header(f"True labels: {', '.join(labels) if labels else 'Negative'}", level=4)
 
@@ -467,7 +709,8 @@ def plot_image_for_subject(subject_id: str,
 
     filepaths = get_image_filepath_from_subject_id(subject_id=str(subject_id),
                                                    dataset=dataset,
-                                                   config=config)
+                                                   config=config,
+                                                   subject_index=subject_index)
 
     if not filepaths:
         print_header(f"Subject ID {subject_id} not found."
@@ -501,54 +744,58 @@ def plot_k_best_and_worst_performing(val_metrics_csv: Path, test_metrics_csv: Pa
                                               k=k,
                                               prediction_target=prediction_target)
 
-    test_metrics = pd.read_csv(test_metrics_csv, dtype=str)
+    test_metrics = read_csv_cached(test_metrics_csv, read_as_str=True)
+    # Split the model outputs by subject once, rather than searching the full table for each subject that is plotted
+    metrics_by_subject = dict(list(test_metrics.groupby(LoggingColumns.Patient.value, sort=False)))
+    no_metrics = test_metrics.iloc[0:0]
 
     df = config.read_dataset_if_needed()
     dataset = ScalarDataset(args=config, data_frame=df)
+    subject_index = get_subject_index(dataset)
 
     im_width = 800
 
     print_header("", level=2)
     print_header(f"Top {k} false positives", level=2)
-    for index, (subject, model_output) in enumerate(zip(results.false_positives[LoggingColumns.Patient.value],
-                                                        results.false_positives[LoggingColumns.ModelOutput.value])):
+    for index, (subject, model_output) in enumerate(iterate_subjects_and_model_outputs(results.false_positives)):
         plot_image_for_subject(subject_id=str(subject),
                                dataset=dataset,
                                im_width=im_width,
                                model_output=model_output,
                                header="False Positive",
                                config=config,
-                               metrics_df=test_metrics)
+                               metrics_df=metrics_by_subject.get(str(subject), no_metrics),
+                               subject_index=subject_index)
 
     print_header(f"Top {k} false negatives", level=2)
-    for index, (subject, model_output) in enumerate(zip(results.false_negatives[LoggingColumns.Patient.value],
-                                                        results.false_negatives[LoggingColumns.ModelOutput.value])):
+    for index, (subject, model_output) in enumerate(iterate_subjects_and_model_outputs(results.false_negatives)):
         plot_image_for_subject(subject_id=str(subject),
                                dataset=dataset,
                                im_width=im_width,
                                model_output=model_output,
                                header="False Negative",
                                config=config,
-                               metrics_df=test_metrics)
+                               metrics_df=metrics_by_subject.get(str(subject), no_metrics),
+                               subject_index=subject_index)
 
     print_header(f"Top {k} true positives", level=2)
-    for index, (subject, model_output) in enumerate(zip(results.true_positives[LoggingColumns.Patient.value],
-                                                        results.true_positives[LoggingColumns.ModelOutput.value])):
+    for index, (subject, model_output) in enumerate(iterate_subjects_and_model_outputs(results.true_positives)):
         plot_image_for_subject(subject_id=str(subject),
                                dataset=dataset,
                                im_width=im_width,
                                model_output=model_output,
                                header="True Positive",
                                config=config,
-                               metrics_df=test_metrics)
+                               metrics_df=metrics_by_subject.get(str(subject), no_metrics),
+                               subject_index=subject_index)
 
     print_header(f"Top {k} true negatives", level=2)
-    for index, (subject, model_output) in enumerate(zip(results.true_negatives[LoggingColumns.Patient.value],
-                                                        results.true_negatives[LoggingColumns.ModelOutput.value])):
+    for index, (subject, model_output) in enumerate(iterate_subjects_and_model_outputs(results.true_negatives)):
         plot_image_for_subject(subject_id=str(subject),
                                dataset=dataset,
                                im_width=im_width,
                                model_output=model_output,
                                header="True Negative",
                                config=config,
-                               metrics_df=test_metrics)
+                               metrics_df=metrics_by_subject.get(str(subject), no_metrics),
+                               subject_index=subject_index)
@@ -98,6 +98,27 @@ def apply_mask_to_posteriors(posteriors: NumpyOrTorch, mask: NumpyOrTorch) -> Nu
     return posteriors
 
 
+@torch.jit.script
+def fuse_logits_to_segmentation(logits: torch.Tensor,
+                                mask: Optional[torch.Tensor]) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Maps model outputs to posteriors via Softmax on the class dimension, applies the mask if given, and computes the
+    segmentation via argmax. This is equivalent to calling apply_mask_to_posteriors and posteriors_to_segmentation
+    in sequence, but is scripted such that the elementwise operations can be fused.
+
+    :param logits: model outputs in shape: Batches x Classes x Z x Y x X
+    :param mask: optional binary mask in shape: Batches x Z x Y x X. For all voxels outside of the mask, the
+    background class posterior is set to 1, and all other class posteriors are set to 0.
+    :return: Tuple of (posteriors, segmentation), where the segmentation has shape Batches x Z x Y x X
+    """
+    posteriors = torch.nn.functional.softmax(logits, dim=1)
+    if mask is not None:
+        inside_mask = (mask != 0).unsqueeze(1).to(posteriors.dtype)
+        posteriors = posteriors * inside_mask
+        posteriors[:, 0] = posteriors[:, 0] + (1.0 - inside_mask[:, 0])
+    return posteriors, posteriors.argmax(dim=1)
+
+
 def pad_images_for_inference(images: np.ndarray,
                              crop_size: TupleInt3,
                              output_size: Optional[TupleInt3],
@@ -111,11 +111,13 @@ class MetricsPerPatientWriter:
         return df
 
 
-def get_number_of_voxels_per_class(labels: torch.Tensor) -> torch.Tensor:
+def get_number_of_voxels_per_class(labels: torch.Tensor, skip_background: bool = False) -> torch.Tensor:
     """
     Computes the number of voxels for each class in a one-hot label map.
     :param labels: one-hot label map in shape Batches x Classes x Z x Y x X or Classes x Z x Y x X
-    :return: A tensor of shape [Batches x Classes] containing the number of non-zero voxels along Z, Y, X
+    :param skip_background: If True, do not count the voxels for the background class at index 0.
+    :return: A tensor of shape [Batches x Classes] containing the number of non-zero voxels along Z, Y, X. If
+    skip_background is True, the tensor has shape [Batches x (Classes - 1)].
     """
     if not len(labels.shape) in [5, 4]:
         raise Exception("labels must have either 4 (Classes x Z x Y x X) "
@@ -124,6 +126,8 @@ def get_number_of_voxels_per_class(labels: torch.Tensor) -> torch.Tensor:
 
     if len(labels.shape) == 4:
         labels = labels[None, ...]
+    if skip_background:
+        labels = labels[:, 1:]
 
     return torch.tensor(np.count_nonzero(labels.cpu().numpy(), axis=(2, 3, 4)))
 
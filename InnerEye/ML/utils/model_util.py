@@ -249,6 +249,24 @@ def create_model_with_temperature_scaling(config: ModelConfigBase) -> Any:
     return model
 
 
+def compile_model(model: torch.nn.Module, **compile_kwargs: Any) -> bool:
+    """
+    Compiles the given model in-place with torch.compile. Compilation is done via the module's own `compile` method,
+    such that the names of all parameters in the state dict are unchanged, and checkpoints remain compatible with
+    models that were trained without compilation. Compilation is skipped on PyTorch versions that do not support it.
+    :param model: The model to compile.
+    :param compile_kwargs: Additional arguments for torch.compile, like `mode` or `dynamic`.
+    :return: True if the model was compiled, False if compilation was skipped.
+    """
+    if not hasattr(model, "compile"):
+        logging.warning(f"Model compilation requires PyTorch 2.2 or higher, but found {torch.__version__}. "
+                        "Skipping compilation.")
+        return False
+    logging.info(f"Compiling model of type {type(model).__name__}. The first minibatch will be slow.")
+    model.compile(**compile_kwargs)  # type: ignore
+    return True
+
+
 E = TypeVar('E', List[ClassificationItemSequence[ScalarItem]], ScalarItem)
 
 
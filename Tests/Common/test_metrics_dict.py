@@ -543,3 +543,21 @@ def test_dataframe_logger() -> None:
         'bar,LearningRate,SecondsPerEpoch,cross_validation_split_index',
         '3.141593,1.000000e-05,123.12,1',
         '3.141593,1.000000e+00,123.12,1']
+
+
+def test_dataframe_logger_add_records() -> None:
+    """
+    Test that adding records in column format gives the same result as adding them one by one.
+    """
+    fixed_columns = {"cross_validation_split_index": 1}
+    out_buffer = StringIO()
+    df = DataframeLogger(csv_path=out_buffer, fixed_columns=fixed_columns)
+    df.add_records({"foo": [1, 2], "bar": [math.pi, 0.5]})
+    df.flush()
+    assert out_buffer.getvalue().splitlines() == [
+        'foo,bar,cross_validation_split_index',
+        '1,3.141593,1',
+        '2,0.500000,1']
+    with pytest.raises(ValueError) as ex:
+        df.add_records({"foo": [1, 2], "bar": [math.pi]})
+    assert "same length" in str(ex)
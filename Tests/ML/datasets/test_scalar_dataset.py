@@ -23,10 +23,11 @@ from InnerEye.ML.dataset.sample import GeneralSampleMetadata
 from InnerEye.ML.dataset.scalar_dataset import DataSourceReader, ScalarDataSource, ScalarDataset, \
     _get_single_channel_row, _string_to_float, extract_label_classification, files_by_stem, \
     is_valid_item_index, load_single_data_source
+from InnerEye.ML.dataset.scalar_sample import ScalarItem
 from InnerEye.ML.photometric_normalization import WindowNormalizationForScalarItem, mri_window
 from InnerEye.ML.scalar_config import LabelTransformation, ScalarLoss, ScalarModelBase
 from InnerEye.ML.utils.dataset_util import CategoricalToOneHotEncoder
-from Tests.ML.util import create_dataset_csv_file
+from Tests.ML.util import create_dataset_csv_file, no_gpu_available
 
 
 def test_get_single_row() -> None:
@@ -906,3 +907,32 @@ def test_get_labels_for_imbalanced_sampler_multilabel(test_output_dirs: OutputFo
     with pytest.raises(NotImplementedError) as ex:
         train_dataset.get_labels_for_imbalanced_sampler()
     assert "ImbalancedSampler is not supported for multilabel tasks." in str(ex)
+
+
+@pytest.mark.gpu
+@pytest.mark.skipif(no_gpu_available, reason="Pinned memory requires a GPU")
+def test_scalar_item_pin_memory() -> None:
+    """
+    Test that pinning a ScalarItem places all its tensors in pinned memory, keeps missing segmentations as None,
+    and that a non-blocking copy of the pinned item to the GPU gives the original values.
+    """
+    item = ScalarItem(metadata=GeneralSampleMetadata(id="foo"),
+                      label=torch.tensor([1.0]),
+                      categorical_non_image_features=torch.tensor([0.0, 1.0]),
+                      numerical_non_image_features=torch.tensor([2.0, 3.0, 4.0]),
+                      images=torch.rand((1, 2, 3, 4)),
+                      segmentations=None)
+    pinned = item.pin_memory()
+    assert isinstance(pinned, ScalarItem)
+    assert pinned.metadata == item.metadata
+    assert pinned.segmentations is None
+    tensor_fields = ["label", "categorical_non_image_features", "numerical_non_image_features", "images"]
+    for field in tensor_fields:
+        assert getattr(pinned, field).is_pinned(), f"{field} should be pinned"
+    on_gpu = pinned.to_device(torch.device("cuda:0"), non_blocking=True)
+    torch.cuda.synchronize()
+    assert on_gpu.segmentations is None
+    for field in tensor_fields:
+        moved = getattr(on_gpu, field)
+        assert moved.is_cuda
+        assert torch.equal(moved.cpu(), getattr(item, field))
@@ -104,8 +104,8 @@ def test_get_pseudo_labels_and_predictions_multiple_hues(test_output_dirs: Outpu
     hues = ["Hue1", "Hue2"]
     csv.loc[::2, LoggingColumns.Hue.value] = hues[0]
     csv.loc[1::2, LoggingColumns.Hue.value] = hues[1]
-    csv.loc[::2, LoggingColumns.Patient.value] = list(range(len(csv)//2))
-    csv.loc[1::2, LoggingColumns.Patient.value] = list(range(len(csv)//2))
+    # Consecutive rows belong to the same subject, one row per prediction target
+    csv[LoggingColumns.Patient.value] = np.repeat(np.arange(len(csv) // 2), 2)
     csv.loc[::2, LoggingColumns.Label.value] = [0, 0, 0, 1, 1, 1]
     csv.loc[1::2, LoggingColumns.Label.value] = [0, 1, 1, 1, 1, 0]
     csv.loc[::2, LoggingColumns.ModelOutput.value] = [0.1, 0.1, 0.1, 0.9, 0.9, 0.9]
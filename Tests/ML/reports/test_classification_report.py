@@ -2,34 +2,80 @@
 #  Copyright (c) Microsoft Corporation. All rights reserved.
 #  Licensed under the MIT License (MIT). See LICENSE in the repo root for license information.
 #  ------------------------------------------------------------------------------------------
+import dataclasses
 import math
-import shutil
 from pathlib import Path
+from typing import Dict, List, Optional, Set
+from unittest import mock
 
 import numpy as np
 import pandas as pd
 import pytest
+from sklearn.metrics import precision_recall_curve, roc_curve
 
 from InnerEye.Common.metrics_constants import LoggingColumns
 from InnerEye.Common.output_directories import OutputFolderForTests
 from InnerEye.Common.common_util import is_windows
-from InnerEye.ML.reports.classification_report import ReportedMetrics, get_correct_and_misclassified_examples, \
+from InnerEye.ML.reports import classification_report
+from InnerEye.ML.reports.classification_report import LabelsAndPredictions, ReportedMetrics, \
+    get_correct_and_misclassified_examples, \
     get_image_filepath_from_subject_id, get_k_best_and_worst_performing, get_metric, get_labels_and_predictions, \
-    plot_image_from_filepath, get_image_labels_from_subject_id, get_image_outputs_from_subject_id
+    plot_image_from_filepath, get_image_labels_from_subject_id, get_image_outputs_from_subject_id, \
+    get_optimal_threshold, read_csv_cached, drop_collinear_points, get_metrics_at_threshold, get_roc_and_pr_curves, \
+    get_positive_counts_at_distinct_values, get_subject_index, METRICS_CSV_COLUMNS
 from InnerEye.ML.reports.notebook_report import generate_classification_notebook
 from InnerEye.ML.scalar_config import ScalarModelBase
-from InnerEye.ML.configs.classification.DummyMulticlassClassification import DummyMulticlassClassification
 from InnerEye.ML.metrics_dict import MetricsDict
 from InnerEye.Azure.azure_util import DEFAULT_CROSS_VALIDATION_SPLIT_INDEX
 from InnerEye.ML.dataset.scalar_dataset import ScalarDataset
 
+REPORTS_FOLDER = Path(__file__).resolve().parent
+TEST_METRICS_FILE = REPORTS_FOLDER / "test_metrics_classification.csv"
+VAL_METRICS_FILE = REPORTS_FOLDER / "val_metrics_classification.csv"
+
+# Column names of the metrics files written during inference
+HUE = LoggingColumns.Hue.value
+EPOCH = LoggingColumns.Epoch.value
+PATIENT = LoggingColumns.Patient.value
+MODEL_OUTPUT = LoggingColumns.ModelOutput.value
+LABEL = LoggingColumns.Label.value
+CROSS_VALIDATION_SPLIT_INDEX = LoggingColumns.CrossValidationSplitIndex.value
+DATA_SPLIT = LoggingColumns.DataSplit.value
+
+
+@pytest.fixture(scope="module")
+def label_channels_dataset_df() -> pd.DataFrame:
+    """
+    A dataset with a label channel and an image channel for each of two subjects. All values are strings, and empty
+    values are NaN, as returned by pd.read_csv with dtype=str for a dataset.csv file. Tests must pass it through
+    _create_dataset, which applies the same pre-processing as when the config reads the file. This is shared by all
+    tests in the module, and must not be modified.
+    """
+    return pd.DataFrame({"subject": ["0", "0", "1", "1"],
+                         "channel": ["label", "image", "label", "image"],
+                         "label": ["0", np.nan, "1", np.nan]})
+
+
+@pytest.fixture(scope="module")
+def labels_and_predictions_val() -> LabelsAndPredictions:
+    """
+    Labels and model outputs read from the validation set metrics file. This is shared by all tests in the module,
+    and must not be modified.
+    """
+    return get_labels_and_predictions(VAL_METRICS_FILE, MetricsDict.DEFAULT_HUE_KEY)
+
+
+@pytest.fixture(scope="module")
+def labels_and_predictions_test() -> LabelsAndPredictions:
+    """
+    Labels and model outputs read from the test set metrics file. This is shared by all tests in the module,
+    and must not be modified.
+    """
+    return get_labels_and_predictions(TEST_METRICS_FILE, MetricsDict.DEFAULT_HUE_KEY)
+
 
 @pytest.mark.skipif(is_windows(), reason="Random timeout errors on windows.")
 def test_generate_classification_report(test_output_dirs: OutputFolderForTests) -> None:
-    reports_folder = Path(__file__).parent
-    test_metrics_file = reports_folder / "test_metrics_classification.csv"
-    val_metrics_file = reports_folder / "val_metrics_classification.csv"
-
     config = ScalarModelBase(label_value_column="label",
                              image_file_column="filePath",
                              subject_column="subject")
@@ -59,159 +105,251 @@ def test_generate_classification_report(test_output_dirs: OutputFolderForTests)
     result_file = test_output_dirs.root_dir / "report.ipynb"
     result_html = generate_classification_notebook(result_notebook=result_file,
                                                    config=config,
-                                                   val_metrics=val_metrics_file,
-                                                   test_metrics=test_metrics_file)
+                                                   val_metrics=VAL_METRICS_FILE,
+                                                   test_metrics=TEST_METRICS_FILE)
     assert result_file.is_file()
     assert result_html.is_file()
     assert result_html.suffix == ".html"
 
 
-def test_get_labels_and_predictions() -> None:
-    reports_folder = Path(__file__).parent
-    test_metrics_file = reports_folder / "test_metrics_classification.csv"
-    results = get_labels_and_predictions(test_metrics_file, MetricsDict.DEFAULT_HUE_KEY)
-    assert all([results.subject_ids[i] == i for i in range(12)])
-    assert all([results.labels[i] == label for i, label in enumerate([1] * 6 + [0] * 6)])
-    assert all([results.model_outputs[i] == op for i, op in enumerate([0.0, 0.2, 0.4, 0.6, 0.8, 1.0] * 2)])
+def test_get_labels_and_predictions(labels_and_predictions_test: LabelsAndPredictions) -> None:
+    results = labels_and_predictions_test
+    np.testing.assert_array_equal(results.subject_ids, np.arange(12))
+    assert results.labels.dtype == np.int8
+    np.testing.assert_array_equal(results.labels, [1] * 6 + [0] * 6)
+    assert results.model_outputs.dtype == np.float32
+    np.testing.assert_array_equal(results.model_outputs,
+                                  np.array([0.0, 0.2, 0.4, 0.6, 0.8, 1.0] * 2, dtype=np.float32))
+
+
+def test_labels_and_predictions_is_frozen(labels_and_predictions_test: LabelsAndPredictions) -> None:
+    """
+    Test that the fields of LabelsAndPredictions can not be re-assigned, such that the object can be shared.
+    """
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        labels_and_predictions_test.labels = np.zeros_like(labels_and_predictions_test.labels)  # type: ignore
 
 
 def test_functions_with_invalid_csv(test_output_dirs: OutputFolderForTests) -> None:
-    reports_folder = Path(__file__).parent
-    test_metrics_file = reports_folder / "test_metrics_classification.csv"
-    val_metrics_file = reports_folder / "val_metrics_classification.csv"
     invalid_metrics_file = Path(test_output_dirs.root_dir) / "invalid_metrics_classification.csv"
-    shutil.copyfile(test_metrics_file, invalid_metrics_file)
-    # Duplicate a subject
-    with open(invalid_metrics_file, "a") as file:
-        file.write(f"{MetricsDict.DEFAULT_HUE_KEY},1,5,1.0,1,-1,Test")
+    # Duplicate a subject. The duplicate row is taken from the file itself, so that it has the same columns.
+    invalid_metrics_file.write_bytes(TEST_METRICS_FILE.read_bytes())
+    metrics = pd.read_csv(TEST_METRICS_FILE)
+    duplicate_row = metrics[metrics[PATIENT] == 5]
+    duplicate_row.to_csv(invalid_metrics_file, mode="a", header=False, index=False)
     with pytest.raises(ValueError) as ex:
         get_labels_and_predictions(invalid_metrics_file, MetricsDict.DEFAULT_HUE_KEY)
     assert "Subject IDs should be unique" in str(ex)
 
     with pytest.raises(ValueError) as ex:
-        get_correct_and_misclassified_examples(invalid_metrics_file, test_metrics_file, MetricsDict.DEFAULT_HUE_KEY)
+        get_correct_and_misclassified_examples(invalid_metrics_file, TEST_METRICS_FILE, MetricsDict.DEFAULT_HUE_KEY)
     assert "Subject IDs should be unique" in str(ex)
 
     with pytest.raises(ValueError) as ex:
-        get_correct_and_misclassified_examples(val_metrics_file, invalid_metrics_file, MetricsDict.DEFAULT_HUE_KEY)
+        get_correct_and_misclassified_examples(VAL_METRICS_FILE, invalid_metrics_file, MetricsDict.DEFAULT_HUE_KEY)
     assert "Subject IDs should be unique" in str(ex)
 
 
-def test_get_metric() -> None:
-    reports_folder = Path(__file__).parent
-    test_metrics_file = reports_folder / "test_metrics_classification.csv"
-    val_metrics_file = reports_folder / "val_metrics_classification.csv"
-
-    val_metrics = get_labels_and_predictions(val_metrics_file, MetricsDict.DEFAULT_HUE_KEY)
-    test_metrics = get_labels_and_predictions(test_metrics_file, MetricsDict.DEFAULT_HUE_KEY)
-
-    optimal_threshold = get_metric(test_labels_and_predictions=test_metrics,
-                                   val_labels_and_predictions=val_metrics,
-                                   metric=ReportedMetrics.OptimalThreshold)
-
-    assert optimal_threshold == 0.6
-
-    optimal_threshold = get_metric(test_labels_and_predictions=test_metrics,
-                                   val_labels_and_predictions=val_metrics,
-                                   metric=ReportedMetrics.OptimalThreshold,
-                                   optimal_threshold=0.3)
-
-    assert optimal_threshold == 0.3
-
-    auc_roc = get_metric(test_labels_and_predictions=test_metrics,
-                         val_labels_and_predictions=val_metrics,
-                         metric=ReportedMetrics.AUC_ROC)
-    assert auc_roc == 0.5
-
-    auc_pr = get_metric(test_labels_and_predictions=test_metrics,
-                        val_labels_and_predictions=val_metrics,
-                        metric=ReportedMetrics.AUC_PR)
-
-    assert math.isclose(auc_pr, 13 / 24, abs_tol=1e-15)
-
-    accuracy = get_metric(test_labels_and_predictions=test_metrics,
-                          val_labels_and_predictions=val_metrics,
-                          metric=ReportedMetrics.Accuracy)
-
-    assert accuracy == 0.5
-
-    accuracy = get_metric(test_labels_and_predictions=test_metrics,
-                          val_labels_and_predictions=val_metrics,
-                          metric=ReportedMetrics.Accuracy,
-                          optimal_threshold=0.1)
-
-    assert accuracy == 0.5
-
-    fpr = get_metric(test_labels_and_predictions=test_metrics,
-                     val_labels_and_predictions=val_metrics,
-                     metric=ReportedMetrics.FalsePositiveRate)
-
-    assert fpr == 0.5
-
-    fpr = get_metric(test_labels_and_predictions=test_metrics,
-                     val_labels_and_predictions=val_metrics,
-                     metric=ReportedMetrics.FalsePositiveRate,
-                     optimal_threshold=0.1)
-
-    assert fpr == 5 / 6
-
-    fnr = get_metric(test_labels_and_predictions=test_metrics,
-                     val_labels_and_predictions=val_metrics,
-                     metric=ReportedMetrics.FalseNegativeRate)
-
-    assert fnr == 0.5
-
-    fnr = get_metric(test_labels_and_predictions=test_metrics,
-                     val_labels_and_predictions=val_metrics,
-                     metric=ReportedMetrics.FalseNegativeRate,
-                     optimal_threshold=0.1)
-
-    assert math.isclose(fnr, 1 / 6, abs_tol=1e-15)
+def test_get_labels_and_predictions_with_missing_label(test_output_dirs: OutputFolderForTests) -> None:
+    """
+    Test that missing labels raise an error, rather than being silently converted to an integer.
+    """
+    metrics = pd.read_csv(TEST_METRICS_FILE)
+    metrics.loc[metrics[PATIENT] == 5, LABEL] = np.nan
+    invalid_metrics_file = Path(test_output_dirs.root_dir) / "missing_label_metrics_classification.csv"
+    metrics.to_csv(invalid_metrics_file, index=False)
+    with pytest.raises(ValueError) as ex:
+        get_labels_and_predictions(invalid_metrics_file, MetricsDict.DEFAULT_HUE_KEY)
+    assert "Labels should not be missing" in str(ex)
+
+
+def test_read_csv_cached(test_output_dirs: OutputFolderForTests) -> None:
+    """
+    Test that csv files are only read again if they have been modified.
+    """
+    csv = test_output_dirs.root_dir / "metrics.csv"
+    csv.write_text("subject,value\n1,2\n")
+    df1 = read_csv_cached(csv)
+    assert df1["value"].tolist() == [2]
+    assert read_csv_cached(csv) is df1
+    df_str = read_csv_cached(csv, read_as_str=True)
+    assert df_str["value"].tolist() == ["2"]
+    csv.write_text("subject,value\n1,2\n3,4\n")
+    df2 = read_csv_cached(csv)
+    assert df2["value"].tolist() == [2, 4]
+
+
+def test_read_csv_cached_metrics_columns() -> None:
+    """
+    Test that only the columns needed for metrics are read, with the expected types.
+    """
+    df = read_csv_cached(TEST_METRICS_FILE, columns=METRICS_CSV_COLUMNS)
+    assert sorted(df.columns) == sorted(METRICS_CSV_COLUMNS)
+    assert df[LABEL].dtype == np.float32
+    assert df[MODEL_OUTPUT].dtype == np.float32
+    assert df[HUE].tolist() == [MetricsDict.DEFAULT_HUE_KEY] * 12
+
+
+@pytest.mark.parametrize("metric, optimal_threshold, expected",
+                         [(ReportedMetrics.OptimalThreshold, None, np.float32(0.6)),
+                          (ReportedMetrics.OptimalThreshold, 0.3, 0.3),
+                          (ReportedMetrics.AUC_ROC, None, 0.5),
+                          (ReportedMetrics.AUC_PR, None, 13 / 24),
+                          (ReportedMetrics.Accuracy, None, 0.5),
+                          (ReportedMetrics.Accuracy, 0.1, 0.5),
+                          (ReportedMetrics.FalsePositiveRate, None, 0.5),
+                          (ReportedMetrics.FalsePositiveRate, 0.1, 5 / 6),
+                          (ReportedMetrics.FalseNegativeRate, None, 0.5),
+                          (ReportedMetrics.FalseNegativeRate, 0.1, 1 / 6)])
+def test_get_metric(labels_and_predictions_val: LabelsAndPredictions,
+                    labels_and_predictions_test: LabelsAndPredictions,
+                    metric: ReportedMetrics,
+                    optimal_threshold: Optional[float],
+                    expected: float) -> None:
+    value = get_metric(test_labels_and_predictions=labels_and_predictions_test,
+                       val_labels_and_predictions=labels_and_predictions_val,
+                       metric=metric,
+                       optimal_threshold=optimal_threshold)
+    assert value == pytest.approx(expected, abs=1e-15)
+
+
+def test_get_optimal_threshold(labels_and_predictions_val: LabelsAndPredictions,
+                               labels_and_predictions_test: LabelsAndPredictions) -> None:
+    val_metrics = labels_and_predictions_val
+    test_metrics = labels_and_predictions_test
+    optimal_threshold = get_optimal_threshold(val_metrics.labels, val_metrics.model_outputs)
+    assert optimal_threshold == np.float32(0.6)
+
+    # Passing in a precomputed threshold must give the same metrics as computing it from the validation set
+    for metric in ReportedMetrics:
+        expected = get_metric(val_labels_and_predictions=val_metrics,
+                              test_labels_and_predictions=test_metrics,
+                              metric=metric)
+        actual = get_metric(val_labels_and_predictions=val_metrics,
+                            test_labels_and_predictions=test_metrics,
+                            metric=metric,
+                            optimal_threshold=optimal_threshold)
+        assert actual == expected
+
+
+def test_get_positive_counts_at_distinct_values() -> None:
+    sorted_outputs = np.array([0.9, 0.7, 0.7, 0.5, 0.2, 0.2, 0.2])
+    sorted_labels = np.array([True, True, False, False, True, False, False])
+    tps, fps, idxs = get_positive_counts_at_distinct_values(sorted_outputs, sorted_labels)
+    assert tps.tolist() == [1, 2, 2, 3]
+    assert fps.tolist() == [0, 1, 2, 4]
+    assert idxs.tolist() == [0, 2, 3, 6]
+
+
+@pytest.mark.parametrize("use_numba", [True, False])
+def test_get_roc_and_pr_curves_matches_sklearn_0_23(use_numba: bool) -> None:
+    """
+    Test that the ROC and PR curves are the same as computed by sklearn 0.23 (the pinned version), including for model
+    outputs with ties. Later versions of sklearn use a different first ROC threshold.
+    Without numba, the curves are computed by sklearn itself.
+    """
+    random = np.random.RandomState(seed=1)
+    labels = random.randint(0, 2, size=100).astype(np.float32)
+    model_outputs = np.round(random.rand(100), decimals=1).astype(np.float32)
+    with mock.patch.object(classification_report, "numba", classification_report.numba if use_numba else None):
+        curves = get_roc_and_pr_curves(labels, model_outputs)
+    fpr, tpr, roc_thresholds = roc_curve(labels, model_outputs, drop_intermediate=True)
+    precision, recall, pr_thresholds = precision_recall_curve(labels, model_outputs)
+    assert np.allclose(curves.fpr, fpr)
+    assert np.allclose(curves.tpr, tpr)
+    assert np.allclose(curves.roc_thresholds, roc_thresholds)
+    assert np.allclose(curves.precision, precision)
+    assert np.allclose(curves.recall, recall)
+    assert np.allclose(curves.pr_thresholds, pr_thresholds)
+
+
+def test_get_metrics_at_threshold() -> None:
+    labels = np.array([1, 1, 1, 0, 0, 0, 0])
+    model_outputs = np.array([0.9, 0.5, 0.1, 0.5, 0.4, 0.2, 0.1])
+    # At threshold 0.5: 2 true positives, 1 false negative, 1 false positive, 3 true negatives
+    accuracy, fpr, fnr = get_metrics_at_threshold(labels, model_outputs, threshold=0.5)
+    assert accuracy == 5 / 7
+    assert fpr == 1 / 4
+    assert math.isclose(fnr, 1 / 3)
+    # Without negative labels, the false positive rate is 1, as when computed via sklearn's recall_score
+    accuracy, fpr, fnr = get_metrics_at_threshold(labels[:3], model_outputs[:3], threshold=0.5)
+    assert accuracy == 2 / 3
+    assert fpr == 1
+    assert math.isclose(fnr, 1 / 3)
+
+
+def test_get_metrics_at_threshold_boundary() -> None:
+    """
+    Test that model outputs equal to the threshold are predicted as positive, for all three metrics. Previously,
+    accuracy used a strict comparison, and the false positive and negative rates did not.
+    """
+    labels = np.array([1, 1, 0])
+    model_outputs = np.array([0.5, 0.5, 0.2])
+    accuracy, fpr, fnr = get_metrics_at_threshold(labels, model_outputs, threshold=0.5)
+    assert accuracy == 1.0
+    assert fpr == 0.0
+    assert fnr == 0.0
+
+
+def test_drop_collinear_points() -> None:
+    # The points at (0, 0.5) and (0.5, 1) are on straight lines between their neighbours. The second to last point is
+    # a duplicate of the last point. The spike at (1, 0.8) changes direction and must be kept.
+    x = np.array([0, 0, 0, 0.5, 1, 1, 1, 1])
+    y = np.array([0, 0.5, 1, 1, 1, 0.8, 0.9, 0.9])
+    x_kept, y_kept = drop_collinear_points(x, y)
+    assert x_kept.tolist() == [0, 0, 1, 1, 1]
+    assert y_kept.tolist() == [0, 1, 1, 0.8, 0.9]
+    # Curves with less than 3 points are returned unchanged
+    x_kept, y_kept = drop_collinear_points(x[:2], y[:2])
+    assert x_kept.tolist() == [0, 0]
+
+
+def _get_patients(df: pd.DataFrame) -> Set[int]:
+    """
+    Returns the set of subject IDs in one of the dataframes returned by get_correct_and_misclassified_examples.
+    """
+    return set(df[PATIENT].astype(int).tolist())
 
 
 def test_get_correct_and_misclassified_examples() -> None:
-    reports_folder = Path(__file__).parent
-    test_metrics_file = reports_folder / "test_metrics_classification.csv"
-    val_metrics_file = reports_folder / "val_metrics_classification.csv"
-
-    results = get_correct_and_misclassified_examples(val_metrics_csv=val_metrics_file,
-                                                     test_metrics_csv=test_metrics_file)
-
-    true_positives = [item[LoggingColumns.Patient.value] for _, item in results.true_positives.iterrows()]
-    assert all([i in true_positives for i in [3, 4, 5]])
-
-    true_negatives = [item[LoggingColumns.Patient.value] for _, item in results.true_negatives.iterrows()]
-    assert all([i in true_negatives for i in [6, 7, 8]])
-
-    false_positives = [item[LoggingColumns.Patient.value] for _, item in results.false_positives.iterrows()]
-    assert all([i in false_positives for i in [9, 10, 11]])
+    results = get_correct_and_misclassified_examples(val_metrics_csv=VAL_METRICS_FILE,
+                                                     test_metrics_csv=TEST_METRICS_FILE)
 
-    false_negatives = [item[LoggingColumns.Patient.value] for _, item in results.false_negatives.iterrows()]
-    assert all([i in false_negatives for i in [0, 1, 2]])
+    assert {3, 4, 5}.issubset(_get_patients(results.true_positives))
+    assert {6, 7, 8}.issubset(_get_patients(results.true_negatives))
+    assert {9, 10, 11}.issubset(_get_patients(results.false_positives))
+    assert {0, 1, 2}.issubset(_get_patients(results.false_negatives))
 
 
 def test_get_k_best_and_worst_performing() -> None:
-    reports_folder = Path(__file__).parent
-    test_metrics_file = reports_folder / "test_metrics_classification.csv"
-    val_metrics_file = reports_folder / "val_metrics_classification.csv"
-
-    results = get_k_best_and_worst_performing(val_metrics_csv=val_metrics_file,
-                                              test_metrics_csv=test_metrics_file,
+    results = get_k_best_and_worst_performing(val_metrics_csv=VAL_METRICS_FILE,
+                                              test_metrics_csv=TEST_METRICS_FILE,
                                               k=2)
 
-    best_true_positives = [item[LoggingColumns.Patient.value] for _, item in results.true_positives.iterrows()]
+    best_true_positives = results.true_positives[PATIENT].astype(int).tolist()
     assert best_true_positives == [5, 4]
 
-    best_true_negatives = [item[LoggingColumns.Patient.value] for _, item in results.true_negatives.iterrows()]
+    best_true_negatives = results.true_negatives[PATIENT].astype(int).tolist()
     assert best_true_negatives == [6, 7]
 
-    worst_false_positives = [item[LoggingColumns.Patient.value] for _, item in results.false_positives.iterrows()]
+    worst_false_positives = results.false_positives[PATIENT].astype(int).tolist()
     assert worst_false_positives == [11, 10]
 
-    worst_false_negatives = [item[LoggingColumns.Patient.value] for _, item in results.false_negatives.iterrows()]
+    worst_false_negatives = results.false_negatives[PATIENT].astype(int).tolist()
     assert worst_false_negatives == [0, 1]
 
 
+def _create_dataset(config: ScalarModelBase, df: pd.DataFrame) -> ScalarDataset:
+    """
+    Creates a dataset from a dataframe with the contents of a dataset.csv file, as returned by pd.read_csv with
+    dtype=str. The dataframe is pre-processed by the config in the same way as when the config reads the file itself,
+    in particular, empty values are replaced by empty strings.
+    """
+    config.dataset_data_frame = df
+    config.pre_process_dataset_dataframe()
+    return ScalarDataset(args=config, data_frame=config.read_dataset_if_needed())
+
+
 def test_get_image_filepath_from_subject_id_single(test_output_dirs: OutputFolderForTests) -> None:
     config = ScalarModelBase(image_file_column="filePath",
                              label_value_column="label",
@@ -219,14 +357,11 @@ def test_get_image_filepath_from_subject_id_single(test_output_dirs: OutputFolde
 
     config.local_dataset = test_output_dirs.root_dir / "dataset"
     config.local_dataset.mkdir()
-    dataset_csv = config.local_dataset / "dataset.csv"
     image_file_name = "image.npy"
-    dataset_csv.write_text(f"subject,filePath,label\n"
-                           f"0,0_{image_file_name},0\n"
-                           f"1,1_{image_file_name},1\n")
-
-    df = config.read_dataset_if_needed()
-    dataset = ScalarDataset(args=config, data_frame=df)
+    df = pd.DataFrame({"subject": ["0", "1"],
+                       "filePath": [f"0_{image_file_name}", f"1_{image_file_name}"],
+                       "label": ["0", "1"]})
+    dataset = _create_dataset(config, df)
 
     Path(config.local_dataset / f"0_{image_file_name}").touch()
     Path(config.local_dataset / f"1_{image_file_name}").touch()
@@ -240,99 +375,71 @@ def test_get_image_filepath_from_subject_id_single(test_output_dirs: OutputFolde
     assert len(filepath) == 1
     assert expected_path.samefile(filepath[0])
 
+    # Looking up the subject via a pre-built index should give the same result
+    subject_index = get_subject_index(dataset)
+    assert filepath == get_image_filepath_from_subject_id(subject_id="1",
+                                                          dataset=dataset,
+                                                          config=config,
+                                                          subject_index=subject_index)
+
     # Check error is raised if the subject does not exist
     with pytest.raises(ValueError) as ex:
         get_image_filepath_from_subject_id(subject_id="100",
                                            dataset=dataset,
                                            config=config)
     assert "Could not find subject" in str(ex)
+    with pytest.raises(ValueError) as ex:
+        get_image_filepath_from_subject_id(subject_id="100",
+                                           dataset=dataset,
+                                           config=config,
+                                           subject_index=subject_index)
+    assert "Could not find subject" in str(ex)
 
 
-def test_get_image_filepath_from_subject_id_with_image_channels(test_output_dirs: OutputFolderForTests) -> None:
-    config = ScalarModelBase(label_channels=["label"],
-                             image_file_column="filePath",
-                             label_value_column="label",
-                             image_channels=["image"],
-                             subject_column="subject")
-
-    config.local_dataset = test_output_dirs.root_dir / "dataset"
-    config.local_dataset.mkdir()
-    dataset_csv = config.local_dataset / "dataset.csv"
-    image_file_name = "image.npy"
-    dataset_csv.write_text(f"subject,channel,filePath,label\n"
-                           f"0,label,,0\n"
-                           f"0,image,0_{image_file_name},\n"
-                           f"1,label,,1\n"
-                           f"1,image,1_{image_file_name},\n")
-
-    df = config.read_dataset_if_needed()
-    dataset = ScalarDataset(args=config, data_frame=df)
-
-    Path(config.local_dataset / f"0_{image_file_name}").touch()
-    Path(config.local_dataset / f"1_{image_file_name}").touch()
-
-    filepath = get_image_filepath_from_subject_id(subject_id="1",
-                                                  dataset=dataset,
-                                                  config=config)
-    expected_path = Path(config.local_dataset / f"1_{image_file_name}")
-
-    assert filepath
-    assert len(filepath) == 1
-    assert filepath[0].samefile(expected_path)
-
-
-def test_get_image_filepath_from_subject_id_multiple(test_output_dirs: OutputFolderForTests) -> None:
+@pytest.mark.parametrize("image_channels", [["image"], ["image1", "image2"]])
+def test_get_image_filepath_from_subject_id_with_image_channels(test_output_dirs: OutputFolderForTests,
+                                                                image_channels: List[str]) -> None:
     config = ScalarModelBase(label_channels=["label"],
                              image_file_column="filePath",
                              label_value_column="label",
-                             image_channels=["image1", "image2"],
+                             image_channels=image_channels,
                              subject_column="subject")
 
     config.local_dataset = test_output_dirs.root_dir / "dataset"
     config.local_dataset.mkdir()
-    dataset_csv = config.local_dataset / "dataset.csv"
     image_file_name = "image.npy"
-    dataset_csv.write_text(f"subject,channel,filePath,label\n"
-                           f"0,label,,0\n"
-                           f"0,image1,00_{image_file_name},\n"
-                           f"0,image2,01_{image_file_name},\n"
-                           f"1,label,,1\n"
-                           f"1,image1,10_{image_file_name},\n"
-                           f"1,image2,11_{image_file_name},\n")
-
-    df = config.read_dataset_if_needed()
-    dataset = ScalarDataset(args=config, data_frame=df)
-
-    Path(config.local_dataset / f"00_{image_file_name}").touch()
-    Path(config.local_dataset / f"01_{image_file_name}").touch()
-    Path(config.local_dataset / f"10_{image_file_name}").touch()
-    Path(config.local_dataset / f"11_{image_file_name}").touch()
+    # Two subjects with one label row and one row per image channel each. Subject 0 has label 0, subject 1 label 1.
+    # Values that are not given are NaN, as returned by pd.read_csv for a dataset.csv file, and are replaced by empty
+    # strings when creating the dataset.
+    rows: List[Dict[str, str]] = []
+    for subject in ["0", "1"]:
+        rows.append({"subject": subject, "channel": "label", "label": subject})
+        rows.extend({"subject": subject, "channel": channel, "filePath": f"{subject}{index}_{image_file_name}"}
+                    for index, channel in enumerate(image_channels))
+    df = pd.DataFrame(rows)
+    dataset = _create_dataset(config, df)
+
+    for file_name in df["filePath"].dropna():
+        Path(config.local_dataset / file_name).touch()
 
     filepath = get_image_filepath_from_subject_id(subject_id="1",
                                                   dataset=dataset,
                                                   config=config)
-    expected_paths = [config.local_dataset / f"10_{image_file_name}",
-                      config.local_dataset / f"11_{image_file_name}"]
+    expected_paths = [config.local_dataset / f"1{index}_{image_file_name}" for index in range(len(image_channels))]
 
     assert filepath
-    assert len(filepath) == 2
-    assert expected_paths[0].samefile(filepath[0])
-    assert expected_paths[1].samefile(filepath[1])
+    assert len(filepath) == len(image_channels)
+    for expected_path, actual_path in zip(expected_paths, filepath):
+        assert expected_path.samefile(actual_path)
 
 
-def test_image_labels_from_subject_id_single(test_output_dirs: OutputFolderForTests) -> None:
+def test_image_labels_from_subject_id_single(label_channels_dataset_df: pd.DataFrame) -> None:
     config = ScalarModelBase(label_value_column="label",
                              subject_column="subject")
 
-    config.local_dataset = test_output_dirs.root_dir / "dataset"
-    config.local_dataset.mkdir()
-    dataset_csv = config.local_dataset / "dataset.csv"
-    dataset_csv.write_text("subject,channel,label\n"
-                           "0,label,0\n"
-                           "1,label,1\n")
-
-    df = config.read_dataset_if_needed()
-    dataset = ScalarDataset(args=config, data_frame=df)
+    # Without label channels, there must only be a single row per subject
+    df = label_channels_dataset_df[label_channels_dataset_df["channel"] == "label"]
+    dataset = _create_dataset(config, df)
 
     labels = get_image_labels_from_subject_id(subject_id="0",
                                               dataset=dataset,
@@ -347,87 +454,68 @@ def test_image_labels_from_subject_id_single(test_output_dirs: OutputFolderForTe
     assert labels[0] == MetricsDict.DEFAULT_HUE_KEY
 
 
-def test_image_labels_from_subject_id_with_label_channels(test_output_dirs: OutputFolderForTests) -> None:
+@pytest.mark.parametrize("class_names, label, expected_labels",
+                         [([MetricsDict.DEFAULT_HUE_KEY], "1", {MetricsDict.DEFAULT_HUE_KEY}),
+                          (["class1", "class2", "class3"], "1|2", {"class2", "class3"})])
+def test_image_labels_from_subject_id_with_label_channels(label_channels_dataset_df: pd.DataFrame,
+                                                          class_names: List[str],
+                                                          label: str,
+                                                          expected_labels: Set[str]) -> None:
     config = ScalarModelBase(label_channels=["label"],
                              label_value_column="label",
-                             subject_column="subject")
-    config.local_dataset = test_output_dirs.root_dir / "dataset"
-    config.local_dataset.mkdir()
-    dataset_csv = config.local_dataset / "dataset.csv"
-    dataset_csv.write_text("subject,channel,label\n"
-                           "0,label,0\n"
-                           "0,image,\n"
-                           "1,label,1\n"
-                           "1,image,\n")
-
-    df = config.read_dataset_if_needed()
-    dataset = ScalarDataset(args=config, data_frame=df)
+                             subject_column="subject",
+                             class_names=class_names)
+    # Set the label of subject 1. The shared dataframe is copied, because it must not be modified.
+    df = label_channels_dataset_df.copy()
+    df.loc[(df["subject"] == "1") & (df["channel"] == "label"), "label"] = label
+    dataset = _create_dataset(config, df)
 
     labels = get_image_labels_from_subject_id(subject_id="1",
                                               dataset=dataset,
                                               config=config)
     assert labels
-    assert len(labels) == 1
-    assert labels[0] == MetricsDict.DEFAULT_HUE_KEY
-
-
-def test_image_labels_from_subject_id_multiple(test_output_dirs: OutputFolderForTests) -> None:
-    config = ScalarModelBase(label_channels=["label"],
-                             label_value_column="label",
-                             subject_column="subject",
-                             class_names=["class1", "class2", "class3"])
-    config.local_dataset = test_output_dirs.root_dir / "dataset"
-    config.local_dataset.mkdir()
-    dataset_csv = config.local_dataset / "dataset.csv"
-    dataset_csv.write_text("subject,channel,label\n"
-                           "0,label,0\n"
-                           "0,image,\n"
-                           "1,label,1|2\n"
-                           "1,image,\n")
-
-    df = config.read_dataset_if_needed()
-    dataset = ScalarDataset(args=config, data_frame=df)
-
-    labels = get_image_labels_from_subject_id(subject_id="1",
-                                                  dataset=dataset,
-                                                  config=config)
-    assert labels
-    assert len(labels) == 2
-    assert set(labels) == {config.class_names[1], config.class_names[2]}
+    assert len(labels) == len(expected_labels)
+    assert set(labels) == expected_labels
 
 
 def test_plot_image_from_filepath(test_output_dirs: OutputFolderForTests) -> None:
     im_width = 200
 
-    array = np.ones([10, 10])
+    array = np.zeros((10, 10), dtype=np.float32)
     valid_file = Path(test_output_dirs.root_dir) / "valid.npy"
     np.save(valid_file, array)
     res = plot_image_from_filepath(valid_file, im_width)
     assert res
 
-    array = np.ones([3, 10, 10])
+    # An image that is much larger than the display width is decimated before resizing
+    array = np.random.rand(1, 1000, 800).astype(np.float32)
+    large_file = Path(test_output_dirs.root_dir) / "large.npy"
+    np.save(large_file, array)
+    res = plot_image_from_filepath(large_file, im_width)
+    assert res
+
+    array = np.zeros((3, 10, 10), dtype=np.float32)
     invalid_file = Path(test_output_dirs.root_dir) / "invalid.npy"
     np.save(invalid_file, array)
     res = plot_image_from_filepath(invalid_file, im_width)
     assert not res
 
 
-def test_get_image_outputs_from_subject_id(test_output_dirs: OutputFolderForTests) -> None:
+def test_get_image_outputs_from_subject_id() -> None:
     hues = ["Hue1", "Hue2"]
 
-    metrics_df = pd.DataFrame.from_dict({LoggingColumns.Hue.value: [hues[0], hues[1]] * 6,
-                                         LoggingColumns.Epoch.value: [0] * 12,
-                                         LoggingColumns.Patient.value: [s for s in range(6) for _ in range(2)],
-                                         LoggingColumns.ModelOutput.value: [0.1, 0.1, 0.1, 0.9, 0.1, 0.9,
-                                                                            0.9, 0.9, 0.9, 0.9, 0.9, 0.1],
-                                         LoggingColumns.Label.value: [0, 0, 0, 1, 0, 1, 1, 1, 1, 1, 1, 0],
-                                         LoggingColumns.CrossValidationSplitIndex: [DEFAULT_CROSS_VALIDATION_SPLIT_INDEX] * 12,
-                                         LoggingColumns.DataSplit.value: [0] * 12,
-                                         }, dtype=str)
-
-    config = DummyMulticlassClassification()
-    config.class_names = hues
-    config.subject_column = "subject"
+    # The report reads the metrics file as strings, hence subject IDs are looked up as strings. The other columns
+    # keep their native types.
+    num_rows = 12
+    metrics_df = pd.DataFrame({HUE: np.tile(hues, num_rows // 2),
+                               EPOCH: np.zeros(num_rows, dtype=np.int64),
+                               PATIENT: np.repeat(np.arange(num_rows // 2), 2).astype(str),
+                               MODEL_OUTPUT: np.array([0.1, 0.1, 0.1, 0.9, 0.1, 0.9,
+                                                       0.9, 0.9, 0.9, 0.9, 0.9, 0.1]),
+                               LABEL: np.array([0, 0, 0, 1, 0, 1, 1, 1, 1, 1, 1, 0]),
+                               CROSS_VALIDATION_SPLIT_INDEX: np.full(num_rows, DEFAULT_CROSS_VALIDATION_SPLIT_INDEX),
+                               DATA_SPLIT: np.zeros(num_rows, dtype=np.int64)},
+                              copy=False)
 
     model_output = get_image_outputs_from_subject_id(subject_id="1",
                                                      metrics_df=metrics_df)
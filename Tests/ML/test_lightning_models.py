@@ -0,0 +1,91 @@
+#  ------------------------------------------------------------------------------------------
+#  Copyright (c) Microsoft Corporation. All rights reserved.
+#  Licensed under the MIT License (MIT). See LICENSE in the repo root for license information.
+#  ------------------------------------------------------------------------------------------
+import contextlib
+from unittest import mock
+
+import pytest
+import torch
+
+from InnerEye.ML.config import SegmentationModelBase
+from InnerEye.ML.lightning_helpers import create_lightning_model
+from InnerEye.ML.lightning_models import SegmentationLightning
+from InnerEye.ML.utils.ml_util import set_random_seed
+from Tests.ML.configs.DummyModel import DummyModel
+
+
+def create_segmentation_model(config: SegmentationModelBase) -> SegmentationLightning:
+    """
+    Creates a segmentation model with randomly initialized weights, using a fixed random seed.
+    :param config: The model configuration.
+    """
+    set_random_seed(42)
+    model = create_lightning_model(config, set_optimizer_and_scheduler=False)
+    assert isinstance(model, SegmentationLightning)
+    return model.eval()
+
+
+def create_image_crop(config: SegmentationModelBase) -> torch.Tensor:
+    """
+    Creates a random image crop of size [1, channels, Z, Y, X] that matches the given model configuration.
+    """
+    return torch.rand((1, len(config.image_channels), *config.crop_size))
+
+
+def test_forward_without_posteriors() -> None:
+    """
+    Test that the segmentation returned by the forward pass without posteriors matches the argmax of the posteriors.
+    """
+    config = DummyModel()
+    model = create_segmentation_model(config)
+    image = create_image_crop(config)
+    with torch.no_grad():
+        posteriors = model(image)
+        segmentation = model(image, return_posteriors=False)
+    assert segmentation.shape == posteriors.shape[:1] + posteriors.shape[2:]
+    assert torch.equal(segmentation, posteriors.argmax(dim=1))
+
+
+def test_channels_last_3d() -> None:
+    """
+    Test that the 5D weights of a segmentation model are stored in channels_last_3d format when the flag is set,
+    and that the model output does not depend on the memory format.
+    """
+    config = DummyModel()
+    image = create_image_crop(config)
+    model = create_segmentation_model(config)
+    model_channels_last = create_segmentation_model(DummyModel(use_channels_last_3d=True))
+    weights = [p for p in model_channels_last.model.parameters() if p.dim() == 5]
+    assert len(weights) > 0
+    for weight in weights:
+        assert weight.is_contiguous(memory_format=torch.channels_last_3d)  # type: ignore
+    with torch.no_grad():
+        expected = model(image)
+        actual = model_channels_last(image)
+    assert torch.allclose(actual, expected, atol=1e-6)
+
+
+@pytest.mark.skipif(hasattr(torch, "autocast"), reason="This PyTorch version supports bfloat16 autocast")
+def test_bfloat16_autocast_unsupported() -> None:
+    """
+    Test that bfloat16 autocast is switched off on PyTorch versions that do not provide torch.autocast, and that
+    the model then runs in the default precision.
+    """
+    model = create_segmentation_model(DummyModel(use_bfloat16_autocast=True))
+    assert not model.use_bfloat16_autocast
+    assert isinstance(model.autocast_context(torch.device("cpu")), contextlib.nullcontext)
+
+
+@pytest.mark.parametrize("use_torch_compile", [True, False])
+def test_compile_only_if_enabled(use_torch_compile: bool) -> None:
+    """
+    Test that the segmentation model is only passed to model compilation if that is enabled in the config.
+    """
+    with mock.patch("InnerEye.ML.utils.model_util.compile_model") as compile_model:
+        model = create_segmentation_model(DummyModel(use_torch_compile=use_torch_compile))
+    if use_torch_compile:
+        compile_model.assert_called_once()
+        assert compile_model.call_args[0][0] is model.model
+    else:
+        compile_model.assert_not_called()
@@ -3,6 +3,7 @@
 #  Licensed under the MIT License (MIT). See LICENSE in the repo root for license information.
 #  ------------------------------------------------------------------------------------------
 import math
+from io import StringIO
 from typing import List, Optional
 
 import numpy as np
@@ -18,8 +19,9 @@ from InnerEye.ML import metrics
 from InnerEye.ML.configs.classification.DummyClassification import DummyClassification
 from InnerEye.ML.configs.regression.DummyRegression import DummyRegression
 from InnerEye.ML.lightning_metrics import AverageWithoutNan, MetricForMultipleStructures, ScalarMetricsBase
-from InnerEye.ML.lightning_models import ScalarLightning
-from InnerEye.ML.metrics_dict import MetricsDict, get_column_name_for_logging
+from InnerEye.ML.lightning_models import ScalarLightning, SubjectOutputsWriter, \
+    convert_diagnostics_to_numpy
+from InnerEye.ML.metrics_dict import DataframeLogger, MetricsDict, get_column_name_for_logging
 
 
 def test_calculate_dice1() -> None:
@@ -150,6 +152,11 @@ def test_compute_dice_across_patches() -> None:
 
     expected_dice = np.vstack([expected_dice_patch0, expected_dice_patch1])
     assert np.allclose(dice, expected_dice, rtol=1.e-5, atol=1.e-8)
+    dice_foreground = metrics.compute_dice_across_patches(prediction_argmax,
+                                                          ground_truth,
+                                                          allow_multiple_classes_for_each_pixel=True,
+                                                          skip_background=True).cpu().numpy()
+    assert np.allclose(dice_foreground, expected_dice[:, 1:], rtol=1.e-5, atol=1.e-8)
 
 
 def test_get_column_name_for_logging() -> None:
@@ -288,3 +295,100 @@ def test_dice_for_multiple_structures() -> None:
     m2.update(values)
     result = list(m2.compute_all())
     assert result == [(m2_name, values)]
+
+
+def test_dice_for_multiple_structures_batched() -> None:
+    """
+    Test that updating MetricForMultipleStructures with a matrix gives the same result as updating it
+    row by row.
+    """
+    structures = ["foo", "bar"]
+    values = torch.tensor([[1.0, math.nan], [0.5, 0.0], [math.nan, math.nan]])
+    m_batched = MetricForMultipleStructures(ground_truth_ids=structures, is_training=True)
+    m_batched.update(values)
+    m_rows = MetricForMultipleStructures(ground_truth_ids=structures, is_training=True)
+    for row in values:
+        m_rows.update(row)
+    result_batched = list(m_batched.compute_all())
+    result_rows = list(m_rows.compute_all())
+    assert [name for name, _ in result_batched] == [name for name, _ in result_rows]
+    for (_, batched), (_, rows) in zip(result_batched, result_rows):
+        assert torch.allclose(batched, rows)
+    # The average across structures is computed per row, skipping NaN: (1.0 + 0.25) / 2
+    assert result_batched[0][1].item() == pytest.approx(0.625)
+    with pytest.raises(ValueError) as ex:
+        m_batched.update(torch.zeros((3, 3)))
+    assert "Expected a tensor with 2 elements per row" in str(ex)
+
+
+def test_subject_outputs_writer() -> None:
+    """
+    Test that records that are written via the background thread arrive in the logger, with tensors
+    contributing one record per entry.
+    """
+    out_buffer = StringIO()
+    logger = DataframeLogger(csv_path=out_buffer)
+    writer = SubjectOutputsWriter()
+    writer.add_records(logger, {"subject": ["1", "2", "3"],
+                                "output": torch.tensor([0.5, 1.0, 0.0])})
+    writer.close()
+    logger.flush()
+    assert out_buffer.getvalue().splitlines() == ["subject,output", "1,0.500000", "2,1.000000", "3,0.000000"]
+
+
+def test_subject_outputs_writer_after_close() -> None:
+    """
+    Test that records can not be added or flushed after the writer has been closed.
+    """
+    logger = DataframeLogger(csv_path=StringIO())
+    writer = SubjectOutputsWriter()
+    writer.close()
+    with pytest.raises(ValueError) as ex:
+        writer.add_records(logger, {"subject": ["1"]})
+    assert "already been closed" in str(ex)
+    with pytest.raises(ValueError) as ex:
+        writer.flush()
+    assert "already been closed" in str(ex)
+
+
+@pytest.mark.gpu
+def test_subject_outputs_writer_gpu() -> None:
+    """
+    Test that GPU tensors are written correctly via pinned staging buffers, and that the staging buffers are re-used
+    across batches.
+    """
+    out_buffer = StringIO()
+    logger = DataframeLogger(csv_path=out_buffer)
+    writer = SubjectOutputsWriter()
+    writer.add_records(logger, {"subject": ["1", "2"],
+                                "output": torch.tensor([0.5, 1.0], device="cuda")})
+    writer.flush()
+    assert writer.free_staging_buffers.qsize() == 1
+    staging_buffers = writer.free_staging_buffers.queue[0]
+    pinned_output = staging_buffers.buffers["output"]
+    assert pinned_output.is_pinned()
+    writer.add_records(logger, {"subject": ["3", "4"],
+                                "output": torch.tensor([0.0, 0.25], device="cuda")})
+    writer.close()
+    assert writer.free_staging_buffers.qsize() == 1
+    assert writer.free_staging_buffers.queue[0] is staging_buffers
+    assert staging_buffers.buffers["output"] is pinned_output
+    logger.flush()
+    assert out_buffer.getvalue().splitlines() == ["subject,output", "1,0.500000", "2,1.000000", "3,0.000000",
+                                                  "4,0.250000"]
+
+
+def test_convert_diagnostics_to_numpy() -> None:
+    """
+    Test that per-batch tensors in a diagnostics list are converted to numpy arrays, keeping one entry per batch.
+    """
+    existing = np.zeros((1, 3))
+    batch1 = torch.tensor([[1, 2, 3], [4, 5, 6]])
+    batch2 = torch.tensor([[7, 8, 9]])
+    diagnostics = [existing, batch1, batch2]
+    convert_diagnostics_to_numpy(diagnostics)
+    assert len(diagnostics) == 3
+    assert diagnostics[0] is existing
+    assert all(isinstance(d, np.ndarray) for d in diagnostics)
+    assert np.array_equal(diagnostics[1], batch1.numpy())
+    assert np.array_equal(diagnostics[2], batch2.numpy())
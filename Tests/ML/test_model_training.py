@@ -6,12 +6,14 @@ import logging
 import os
 import shutil
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
+from unittest import mock
 
 import h5py
 import numpy as np
 import pandas as pd
 import pytest
+import torch
 from torch.utils.data import DataLoader
 
 from InnerEye.Common import fixed_paths
@@ -27,7 +29,8 @@ from InnerEye.ML.config import MixtureLossComponent, SegmentationLoss
 from InnerEye.ML.configs.classification.DummyClassification import DummyClassification
 from InnerEye.ML.dataset.sample import CroppedSample
 from InnerEye.ML.deep_learning_config import DeepLearningConfig
-from InnerEye.ML.model_training import model_train
+from InnerEye.ML.lightning_models import SegmentationLightning
+from InnerEye.ML.model_training import create_lightning_trainer, model_train
 from InnerEye.ML.models.losses.mixture import MixtureLoss
 from InnerEye.ML.utils.io_util import load_nifti_image
 from InnerEye.ML.utils.model_util import create_segmentation_loss_function
@@ -204,6 +207,63 @@ def _test_model_train(output_dirs: OutputFolderForTests,
     # assert len(example_files) == 3 * 2
 
 
+def test_validation_step_without_gradients(test_output_dirs: OutputFolderForTests) -> None:
+    """
+    Test that Lightning disables gradient computation when running the validation steps of a segmentation model,
+    such that the validation loss is not attached to a computation graph.
+    """
+    config = DummyModel()
+    config.local_dataset = base_path
+    config.set_output_to(test_output_dirs.root_dir)
+    config.num_epochs = 1
+    original_step = SegmentationLightning.training_or_validation_step
+    validation_steps: List[Tuple[bool, bool]] = []
+
+    def step_and_record(self: SegmentationLightning, sample: Dict[str, Any], batch_index: int,
+                        is_training: bool) -> torch.Tensor:
+        loss = original_step(self, sample, batch_index, is_training)
+        if not is_training:
+            validation_steps.append((torch.is_grad_enabled(), loss.requires_grad))
+        return loss
+
+    checkpoint_handler = get_default_checkpoint_handler(model_config=config,
+                                                        project_root=test_output_dirs.root_dir)
+    with mock.patch.object(SegmentationLightning, "training_or_validation_step", step_and_record):
+        model_train(config, checkpoint_handler=checkpoint_handler)
+    assert len(validation_steps) > 0
+    for grad_enabled, loss_requires_grad in validation_steps:
+        assert not grad_enabled
+        assert not loss_requires_grad
+
+
+@pytest.mark.parametrize("num_gpus", [0, 1, 2])
+def test_create_lightning_trainer_ddp_plugin(test_output_dirs: OutputFolderForTests, num_gpus: int) -> None:
+    """
+    Test that the DDP plugin is created with the bucket settings from the config when training with the "ddp"
+    accelerator, and that no plugin is created otherwise.
+    """
+    config = DummyModel()
+    config.set_output_to(test_output_dirs.root_dir)
+    config.max_num_gpus = -1
+    config.ddp_bucket_cap_mb = 50
+    config.ddp_gradient_as_bucket_view = True
+    # Pretend that there are GPUs, without running the validation in the use_gpu setter.
+    config._use_gpu = num_gpus > 0
+    with mock.patch("torch.cuda.device_count", return_value=num_gpus):
+        with mock.patch("InnerEye.ML.model_training.DDPPlugin") as ddp_plugin:
+            with mock.patch("InnerEye.ML.model_training.Trainer") as trainer:
+                create_lightning_trainer(config)
+    trainer_args = trainer.call_args[1]
+    if num_gpus > 1:
+        assert trainer_args["accelerator"] == "ddp"
+        ddp_plugin.assert_called_once_with(bucket_cap_mb=50, gradient_as_bucket_view=True)
+        assert trainer_args["plugins"] == [ddp_plugin.return_value]
+    else:
+        assert trainer_args["accelerator"] is None
+        ddp_plugin.assert_not_called()
+        assert trainer_args["plugins"] is None
+
+
 def test_create_data_loaders() -> None:
     train_config = DummyModel()
     create_data_loaders(train_config)
@@ -133,6 +133,23 @@ def test_apply_mask_to_posteriors(image_size: List[int]) -> None:
     assert np.all(image[1:, 1:, ...] == 0)
 
 
+@pytest.mark.parametrize("use_mask", [True, False])
+def test_fuse_logits_to_segmentation(use_mask: bool) -> None:
+    """
+    Test that the fused computation of posteriors and segmentation gives the same result as applying
+    Softmax, masking and argmax in sequence.
+    """
+    logits = torch.randn((2, 3, 4, 5, 6))
+    mask = torch.randint(0, 2, (2, 4, 5, 6)) if use_mask else None
+    posteriors, segmentation = image_util.fuse_logits_to_segmentation(logits, mask)
+    expected_posteriors = torch.nn.functional.softmax(logits, dim=1)
+    if mask is not None:
+        expected_posteriors = image_util.apply_mask_to_posteriors(posteriors=expected_posteriors, mask=mask)
+    expected_segmentation = image_util.posteriors_to_segmentation(expected_posteriors)
+    assert torch.allclose(posteriors, expected_posteriors)
+    assert torch.equal(segmentation, expected_segmentation)
+
+
 def test_posteriors_to_segmentation() -> None:
     """
     Test to make sure the posterior to segmentation conversion is as expected
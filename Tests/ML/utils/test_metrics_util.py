@@ -35,6 +35,9 @@ def test_get_number_of_voxels_per_class() -> None:
     count_batched = get_number_of_voxels_per_class(batched_labels)
     assert count_batched.shape == (number_batches, 3)
     assert count_batched.tolist() == [[2, 1, 1]] * number_batches
+    count_foreground = get_number_of_voxels_per_class(batched_labels, skip_background=True)
+    assert count_foreground.shape == (number_batches, 2)
+    assert count_foreground.tolist() == [[1, 1]] * number_batches
 
 
 def test_get_label_overlap_stats() -> None:
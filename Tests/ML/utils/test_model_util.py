@@ -2,6 +2,7 @@
 #  Copyright (c) Microsoft Corporation. All rights reserved.
 #  Licensed under the MIT License (MIT). See LICENSE in the repo root for license information.
 #  ------------------------------------------------------------------------------------------
+import logging
 import time
 from pathlib import Path
 from typing import Any
@@ -18,6 +19,7 @@ from InnerEye.ML.config import SegmentationModelBase
 from InnerEye.ML.lightning_helpers import create_lightning_model, load_from_checkpoint_and_adjust_for_inference
 from InnerEye.ML.model_config_base import ModelConfigBase
 from InnerEye.ML.model_training import create_lightning_trainer
+from InnerEye.ML.utils.model_util import compile_model
 from Tests.ML.configs.ClassificationModelForTesting import ClassificationModelForTesting
 from Tests.ML.configs.DummyModel import DummyModel
 from Tests.ML.util import machine_has_gpu
@@ -167,3 +169,21 @@ def test_cleanup_checkpoints2(test_output_dirs: OutputFolderForTests) -> None:
     assert len(list(folder.glob("*"))) == 2
     assert (folder / BEST_CHECKPOINT_FILE_NAME_WITH_SUFFIX).is_file()
     assert (folder / RECOVERY_CHECKPOINT_FILE_NAME_WITH_SUFFIX).is_file()
+
+
+@pytest.mark.skipif(hasattr(torch.nn.Module, "compile"), reason="This PyTorch version supports model compilation")
+def test_compile_model_unsupported(caplog: Any) -> None:
+    """
+    Test that model compilation is skipped with a warning on PyTorch versions that do not support it, leaving the
+    model unchanged.
+    """
+    model = torch.nn.Linear(2, 1)
+    forward = model.forward
+    state_dict = {name: value.clone() for name, value in model.state_dict().items()}
+    with caplog.at_level(logging.WARNING):
+        assert not compile_model(model, mode="reduce-overhead", dynamic=False)
+    assert "Model compilation requires PyTorch 2.2 or higher" in caplog.text
+    assert model.forward == forward
+    assert model.state_dict().keys() == state_dict.keys()
+    for name, value in model.state_dict().items():
+        assert torch.equal(value, state_dict[name])